@@ -0,0 +1,184 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from dotenv import load_dotenv
+
+# Pipeline types that get their own concurrency limit
+PIPELINES = ("policy", "reviews")
+
+
+class AdmissionRejected(Exception):
+    """Raised when a pipeline run can't be admitted; maps to 429"""
+
+    def __init__(self, pipeline: str, reason: str, retry_after: int):
+        super().__init__(f"{pipeline} pipeline busy ({reason}), retry after {retry_after}s")
+        self.pipeline = pipeline
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class PipelineGate:
+    """
+    Concurrency limit for one pipeline type with a bounded wait queue.
+
+    Waiters are kept per client and woken round-robin across clients, so
+    one client with many queued runs can't starve the others. A client may
+    hold at most max_per_client running-or-queued slots.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int,
+                 queue_timeout: float, max_per_client: int):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_per_client = max_per_client
+        self.active = 0
+        self.active_by_client = Counter()
+        self.waiting: "OrderedDict[str, deque[asyncio.Future]]" = OrderedDict()
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = Counter()
+        # Moving average of run time, used for Retry-After estimates
+        self.avg_duration = 10.0
+
+    def _client_load(self, client: str) -> int:
+        return self.active_by_client[client] + len(self.waiting.get(client, ()))
+
+    def retry_after(self) -> int:
+        waves = (self.queued + 1) / max(self.max_concurrency, 1)
+        return max(1, math.ceil(self.avg_duration * waves))
+
+    def _reject(self, reason: str):
+        self.rejected[reason] += 1
+        raise AdmissionRejected(self.name, reason, self.retry_after())
+
+    def _admit(self, client: str):
+        self.active += 1
+        self.active_by_client[client] += 1
+        self.admitted += 1
+
+    async def acquire(self, client: str):
+        if self._client_load(client) >= self.max_per_client:
+            self._reject("client_limit")
+
+        if self.active < self.max_concurrency and not self.queued:
+            self._admit(client)
+            return
+
+        if self.queued >= self.max_queue:
+            self._reject("queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.setdefault(client, deque()).append(future)
+        self.queued += 1
+        try:
+            # release() admits us before resolving the future
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._remove_waiter(client, future)
+            self._reject("timeout")
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as the caller went away; hand the slot back
+                self.release(client)
+            else:
+                self._remove_waiter(client, future)
+            raise
+
+    def _remove_waiter(self, client: str, future: asyncio.Future):
+        waiters = self.waiting.get(client)
+        if waiters and future in waiters:
+            waiters.remove(future)
+            self.queued -= 1
+            if not waiters:
+                del self.waiting[client]
+
+    def release(self, client: str, duration: Optional[float] = None):
+        self.active -= 1
+        self.active_by_client[client] -= 1
+        if self.active_by_client[client] <= 0:
+            del self.active_by_client[client]
+        if duration is not None:
+            self.avg_duration = 0.8 * self.avg_duration + 0.2 * duration
+
+        # Wake the next client in rotation
+        while self.waiting and self.active < self.max_concurrency:
+            next_client, waiters = self.waiting.popitem(last=False)
+            future = waiters.popleft()
+            self.queued -= 1
+            if waiters:
+                self.waiting[next_client] = waiters
+            if future.done():
+                continue
+            self._admit(next_client)
+            future.set_result(True)
+
+    def stats(self) -> dict:
+        return {
+            "pipeline": self.name,
+            "active": self.active,
+            "queued": self.queued,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected["queue_full"],
+            "rejected_client_limit": self.rejected["client_limit"],
+            "rejected_timeout": self.rejected["timeout"],
+        }
+
+
+class AdmissionController:
+    def __init__(self, gates: dict[str, PipelineGate]):
+        self.gates = gates
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        load_dotenv()
+        gates = {}
+        for pipeline in PIPELINES:
+            prefix = f"ADMISSION_{pipeline.upper()}"
+            max_concurrency = int(os.getenv(f"{prefix}_CONCURRENCY", "4"))
+            # Below the concurrency limit by default, so one client can't fill every slot
+            max_per_client = os.getenv("ADMISSION_MAX_PER_CLIENT")
+            gates[pipeline] = PipelineGate(
+                pipeline,
+                max_concurrency=max_concurrency,
+                max_queue=int(os.getenv(f"{prefix}_QUEUE_SIZE", "32")),
+                queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30")),
+                max_per_client=int(max_per_client) if max_per_client else max(1, max_concurrency // 2),
+            )
+        return cls(gates)
+
+    @asynccontextmanager
+    async def slot(self, pipeline: str, client: str):
+        """Hold a run slot for pipeline; raises AdmissionRejected when full"""
+        gate = self.gates[pipeline]
+        await gate.acquire(client)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            gate.release(client, time.perf_counter() - started)
+
+    def stats(self) -> list[dict]:
+        return [gate.stats() for gate in self.gates.values()]
+
+
+_controller_lock = threading.Lock()
+_controller: Optional[AdmissionController] = None
+
+def get_admission_controller() -> AdmissionController:
+    """Return the process-wide admission controller, reading config on first call"""
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = AdmissionController.from_env()
+    return _controller
@@ -0,0 +1,213 @@
+from pymongo import AsyncMongoClient, ReturnDocument
+from pymongo.server_api import ServerApi
+from pymongo.errors import DuplicateKeyError, OperationFailure
+import os
+from dotenv import load_dotenv
+from typing import Optional
+
+from database import (INDEXED_POLICIES_QUERY, SIMILARITY_STATS_ID, VERSION_COUNTER_FILTER, VERSION_COUNTER_UPDATE,
+                      changes_query, details_update, existence_query, format_document, merge_details,
+                      placeholder_replacement, similarity_stats, website_document)
+
+class AsyncMongoDBManager:
+    """
+    asyncio counterpart of MongoDBManager for the API routes, so waiting on
+    Atlas never blocks the event loop or holds a worker thread. Create it
+    with `await AsyncMongoDBManager.connect()` and share it for the process.
+    """
+
+    def __init__(self, client: AsyncMongoClient):
+        self.client = client
+        self.db = self.client["website_manager"]
+        self.collection = self.db["websites"]
+        self.policy_documents = self.db["policy_documents"]
+        self.policy_index_stats = self.db["policy_index_stats"]
+        self.reviews = self.db["reviews"]
+        self.counters = self.db["counters"]
+        self.website_details = self.db["website_details"]
+        self.usage = self.db["usage"]
+
+    @classmethod
+    async def connect(cls) -> "AsyncMongoDBManager":
+        load_dotenv()
+        client = AsyncMongoClient(os.getenv("MONGO_URI"), server_api=ServerApi('1'))
+        try:
+            await client.admin.command('ping')
+            print("Pinged your deployment. You successfully connected to MongoDB (async)!")
+            manager = cls(client)
+            await manager._create_indexes()
+            return manager
+        except OperationFailure as e:
+            print(f"Database connection failed: {e}")
+            await client.close()
+            raise
+
+    async def _create_indexes(self):
+        """Create indexes the routes rely on"""
+        try:
+            await self.collection.create_index([("url", 1)], unique=True)
+            await self.collection.create_index([("version", 1)])
+            print("Database indexes verified (async)")
+        except Exception as e:
+            print(f"Index creation failed: {e}")
+            raise
+
+    async def _save_details(self, url: str, details: dict):
+        """Upsert the large fields of a website into website_details"""
+        if details:
+            await self.website_details.update_one({"_id": url}, details_update(details), upsert=True)
+
+    async def _attach_details(self, documents: list[dict]) -> list[dict]:
+        """Load website_details for a batch of website documents"""
+        urls = [doc["url"] for doc in documents]
+        if urls:
+            details = {d["_id"]: d async for d in self.website_details.find({"_id": {"$in": urls}})}
+            for doc in documents:
+                merge_details(doc, details.get(doc["url"]))
+        return documents
+
+    async def _next_version(self) -> int:
+        """Monotonic version for the websites change feed"""
+        counter = await self.counters.find_one_and_update(
+            VERSION_COUNTER_FILTER,
+            VERSION_COUNTER_UPDATE,
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return counter["seq"]
+
+    async def add_website(
+        self,
+        url: str,
+        message: str,
+        extended_message: str,
+        reviews_message: Optional[str],
+        reviews_extended_message: Optional[str]
+    ) -> str:
+        """
+        Add a website with security and review information
+        """
+        document, details = website_document(
+            url, message, extended_message, reviews_message, reviews_extended_message, await self._next_version()
+        )
+
+        try:
+            result = await self.collection.insert_one(document)
+            await self._save_details(url, details)
+            print(f"Inserted document with ID: {result.inserted_id}")
+            return str(result.inserted_id)
+        except DuplicateKeyError:
+            existing = await self.collection.find_one_and_update(
+                *placeholder_replacement(url, document),
+                return_document=ReturnDocument.AFTER
+            )
+            if existing:
+                await self._save_details(url, details)
+                print(f"Replaced pending document for {url}")
+                return str(existing["_id"])
+            print(f"Duplicate URL detected: {url}")
+            return None
+        except Exception as e:
+            print(f"Insert operation failed: {e}")
+            raise
+
+    async def website_exists(self, url: str) -> bool:
+        """Check if a website exists by URL; see existence_query"""
+        try:
+            count = await self.collection.count_documents(existence_query(url), limit=1)
+            print(f"Existence check for {url}: {bool(count)}")
+            return bool(count)
+        except Exception as e:
+            print(f"Existence check failed: {e}")
+            raise
+
+    async def get_website(self, url: str, include_details: bool = True) -> dict:
+        """Retrieve a website; the extended messages only if include_details"""
+        try:
+            document = await self.collection.find_one({"url": url})
+            if document:
+                if include_details:
+                    merge_details(document, await self.website_details.find_one({"_id": url}))
+                document = format_document(document, details=include_details)
+                print(f"Retrieved document for {url}")
+            else:
+                print(f"No document found for {url}")
+            return document
+        except Exception as e:
+            print(f"Retrieval operation failed: {e}")
+            raise
+
+    async def get_all_websites(self, include_details: bool = True) -> list[dict]:
+        """Retrieve all websites with formatted messages"""
+        try:
+            websites = [doc async for doc in self.collection.find()]
+            if include_details:
+                await self._attach_details(websites)
+            websites = [format_document(doc, details=include_details) for doc in websites]
+            print(f"Retrieved {len(websites)} websites from database")
+            return websites
+        except Exception as e:
+            print(f"Failed to retrieve websites: {e}")
+            raise
+
+    async def get_changes(self, since: int, limit: int = 100, settle_seconds: float = 2.0) -> list[dict]:
+        """Websites changed after version `since`, oldest first; see changes_query"""
+        try:
+            cursor = self.collection.find(changes_query(since, settle_seconds)).sort("version", 1).limit(limit)
+            changes = [format_document(doc) for doc in await self._attach_details([doc async for doc in cursor])]
+            print(f"Retrieved {len(changes)} changes since version {since}")
+            return changes
+        except Exception as e:
+            print(f"Change feed query failed: {e}")
+            raise
+
+    async def get_reviews(self, domain: str) -> list[dict]:
+        """Rating and date of every stored review for a domain"""
+        try:
+            cursor = self.reviews.find({"domain": domain}, {"_id": 0, "rating": 1, "date": 1})
+            return [doc async for doc in cursor]
+        except Exception as e:
+            print(f"Review lookup failed: {e}")
+            raise
+
+    async def get_similarity_stats(self) -> dict:
+        """Lookups, hits and hit rate of the near-duplicate index"""
+        try:
+            return similarity_stats(
+                await self.policy_index_stats.find_one({"_id": SIMILARITY_STATS_ID}),
+                await self.policy_documents.count_documents(INDEXED_POLICIES_QUERY)
+            )
+        except Exception as e:
+            print(f"Similarity stats lookup failed: {e}")
+            raise
+
+    async def get_usage(self, day: str, domain: Optional[str] = None, limit: int = 20) -> dict:
+        """A domain's usage for a day, or the day's totals with its top domains by tokens"""
+        try:
+            if domain:
+                document = await self.usage.find_one({"_id": f"{day}:{domain}"}, {"_id": 0})
+                return document or {"day": day, "domain": domain, "totals": {}, "stages": {}, "endpoints": {}}
+            document = await self.usage.find_one({"_id": f"{day}:*"}, {"_id": 0}) or {}
+            cursor = self.usage.find(
+                {"day": day, "domain": {"$ne": "*"}},
+                {"_id": 0, "domain": 1, "totals": 1}
+            ).sort("totals.tokens", -1).limit(limit)
+            return {
+                "day": day,
+                "totals": document.get("totals", {}),
+                "stages": document.get("stages", {}),
+                "endpoints": document.get("endpoints", {}),
+                "top_domains": [doc async for doc in cursor]
+            }
+        except Exception as e:
+            print(f"Usage lookup failed: {e}")
+            raise
+
+    async def close(self):
+        """Close the MongoDB connection"""
+        try:
+            await self.client.close()
+            print("Async database connection closed")
+        except Exception as e:
+            print(f"Error closing connection: {e}")
+            raise
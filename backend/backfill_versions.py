@@ -0,0 +1,13 @@
+# backfill_versions.py
+from database import MongoDBManager
+
+def backfill_versions():
+    try:
+        with MongoDBManager() as db:
+            count = db.backfill_versions()
+            print(f"Assigned change feed versions to {count} documents")
+    except Exception as e:
+        print(f"Error backfilling versions: {str(e)}")
+
+if __name__ == "__main__":
+    backfill_versions()
@@ -0,0 +1,121 @@
+# bench_startup.py
+"""
+Measure API cold-start cost.
+
+Reports the slowest imports from `python -X importtime -c "import server"`
+and the time from spawning `uvicorn server:app` to the first answered
+HTTP request. Run from the backend directory:
+
+    python bench_startup.py --top 15 --output startup_bench.jsonl
+
+Each run appends one JSON line to --output so regressions can be tracked.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+from typing import Optional
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_time_summary(module: str, top: int) -> dict:
+    """Run `-X importtime` on module and return total plus slowest imports"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True
+    )
+    entries = []
+    for line in result.stderr.splitlines():
+        # Format: "import time:   self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line.split(":", 1)[1].split("|", 2)
+            entries.append({
+                "module": name.strip(),
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+                # Top-level imports have no leading indentation in the name column
+                "top_level": not name[1:].startswith(" ")
+            })
+        except ValueError:
+            continue
+
+    total_ms = sum(e["cumulative_ms"] for e in entries if e["top_level"])
+    slowest = sorted(entries, key=lambda e: e["cumulative_ms"], reverse=True)[:top]
+    return {
+        "module": module,
+        "ok": result.returncode == 0,
+        "total_ms": round(total_ms, 1),
+        "slowest": slowest
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_first_request(app: str, path: str, timeout: float) -> Optional[float]:
+    """Spawn uvicorn and poll until the first request is answered"""
+    port = _free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if proc.poll() is not None:
+                return None
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=1):
+                    return round((time.perf_counter() - started) * 1000, 1)
+            except urllib.error.HTTPError:
+                # Any HTTP status means the worker is serving
+                return round((time.perf_counter() - started) * 1000, 1)
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                time.sleep(0.02)
+        return None
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Startup benchmark for the API")
+    parser.add_argument("--module", default="server")
+    parser.add_argument("--app", default="server:app")
+    parser.add_argument("--path", default="/docs", help="Route hit for time-to-first-request")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="Append results as a JSON line to this file")
+    args = parser.parse_args()
+
+    summary = import_time_summary(args.module, args.top)
+    summary["time_to_first_request_ms"] = time_to_first_request(args.app, args.path, args.timeout)
+    summary["timestamp"] = datetime.utcnow().isoformat()
+
+    print(f"import {args.module}: {summary['total_ms']} ms (ok={summary['ok']})")
+    for entry in summary["slowest"]:
+        print(f"  {entry['cumulative_ms']:>9.1f} ms  {entry['module']}")
+    print(f"time to first request: {summary['time_to_first_request_ms']} ms")
+
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(summary) + "\n")
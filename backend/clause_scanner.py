@@ -0,0 +1,159 @@
+import re
+from bisect import bisect_right
+
+# Risky clause categories, most severe first. All patterns are compiled into
+# one alternation so a document is scanned in a single pass.
+CLAUSE_PATTERNS = {
+    "arbitration": (
+        "Forced arbitration",
+        [
+            r"binding arbitration",
+            r"arbitrat(?:e|ion) (?:of )?(?:any|all) (?:claims?|disputes?)",
+            r"waive (?:your|the|any) right to (?:a )?(?:jury trial|trial by jury|go to court|sue)",
+        ],
+    ),
+    "class_action_waiver": (
+        "Class-action waiver",
+        [
+            r"class[- ]action (?:waiver|lawsuits?|claims?)",
+            r"(?:only )?on an individual basis",
+            r"class,? (?:consolidated )?or representative (?:action|proceeding)s?",
+        ],
+    ),
+    "data_sale": (
+        "Personal data sold or shared",
+        [
+            r"sell (?:your )?personal (?:data|information)",
+            r"sale of (?:your )?personal (?:data|information)",
+            r"share (?:your )?(?:personal )?(?:data|information) with (?:third[- ]part(?:y|ies)|advertis\w+|(?:our )?partners)",
+            r"(?:targeted|interest[- ]based|cross[- ]context behavioral) advertising",
+            r"data brokers?",
+        ],
+    ),
+    "auto_renewal": (
+        "Automatic renewal",
+        [
+            r"automatic(?:ally)? renew\w*",
+            r"auto[- ]renew\w*",
+            r"recurring (?:billing|charges?|payments?|fees?)",
+            r"until (?:you )?cancel",
+        ],
+    ),
+    "unilateral_changes": (
+        "Terms can change without consent",
+        [
+            r"(?:modify|change|amend|revise|update) (?:these|this|the|our) (?:terms|agreement|policy) (?:at any time|from time to time)",
+            r"at any time,? (?:with or )?without (?:prior )?notice",
+            r"(?:in|at) (?:our|its) sole discretion",
+            r"continued use .{0,60}? constitutes? (?:your )?acceptance",
+        ],
+    ),
+}
+
+_CLAUSE_RE = re.compile(
+    "|".join(f"(?P<{category}>{'|'.join(patterns)})" for category, (_, patterns) in CLAUSE_PATTERNS.items()),
+    re.IGNORECASE,
+)
+# Markdown headings and numbered clause lines ("12.3 Disputes", "Section 4 Fees")
+_SECTION_RE = re.compile(
+    r"^(?:#{1,6}\s+(?P<heading>.+)|\s*(?:\*\*)?(?P<number>(?:Section|§)\s*\d+(?:\.\d+)*|\d+(?:\.\d+)*\.?)\s+(?P<title>[A-Z][^\n]{0,80}))$",
+    re.MULTILINE,
+)
+_MARKUP_RE = re.compile(r"[*_`#\[\]]|\([^)]*\)")
+
+
+def _sections(text: str) -> tuple[list[int], list[str]]:
+    """Start offsets and labels of every section in a markdown document"""
+    starts, labels = [], []
+    for match in _SECTION_RE.finditer(text):
+        if match.group("heading"):
+            label = match.group("heading")
+        else:
+            label = f"{match.group('number')} {match.group('title')}"
+        label = re.sub(r"\s+", " ", _MARKUP_RE.sub("", label)).strip()
+        if label:
+            starts.append(match.start())
+            labels.append(label[:80])
+    return starts, labels
+
+
+def scan_document(text: str, document: str) -> list[dict]:
+    """
+    Find risky clauses in one policy document.
+
+    Returns one hit per (category, section):
+    {"category", "label", "document", "section", "excerpt"}
+    """
+    if not text:
+        return []
+    starts, labels = _sections(text)
+    hits = {}
+    for match in _CLAUSE_RE.finditer(text):
+        category = match.lastgroup
+        index = bisect_right(starts, match.start()) - 1
+        section = labels[index] if index >= 0 else None
+        if (category, section) in hits:
+            continue
+        excerpt = text[max(match.start() - 80, 0):match.end() + 80]
+        hits[(category, section)] = {
+            "category": category,
+            "label": CLAUSE_PATTERNS[category][0],
+            "document": document,
+            "section": section,
+            "excerpt": re.sub(r"\s+", " ", _MARKUP_RE.sub("", excerpt)).strip()
+        }
+    return list(hits.values())
+
+
+def scan_policies(terms_markdown: str, privacy_markdown: str) -> list[dict]:
+    """Scan both policies; hits are ordered by category severity"""
+    hits = scan_document(terms_markdown, "terms") + scan_document(privacy_markdown, "privacy")
+    order = list(CLAUSE_PATTERNS)
+    return sorted(hits, key=lambda hit: order.index(hit["category"]))
+
+
+def _reference(hit: dict) -> str:
+    document = "Terms" if hit["document"] == "terms" else "Privacy policy"
+    return f"{document} § {hit['section']}" if hit["section"] else document
+
+
+def provisional_messages(hits: list[dict], analysis_running: bool = True) -> tuple[str, str]:
+    """
+    (message, extended_message) built from scanner hits, in the same shape
+    as the LLM analysis so it can be served until that lands.
+    analysis_running=False words it as the only result for now (LLM budget spent).
+    """
+    if analysis_running:
+        status, detail, heading = ("Full analysis in progress", "A detailed analysis is in progress",
+                                   "Quick scan (provisional, full analysis in progress)")
+    else:
+        status, detail, heading = ("Based on a quick scan only", "No detailed analysis has been run yet",
+                                   "Quick scan (no detailed analysis yet)")
+    if not hits:
+        return (
+            f"- No high-risk clauses found by the quick scan\n- {status}",
+            f"## Quick scan\n- No forced arbitration, class-action waiver, data sale, auto-renewal or unilateral change clauses matched\n- {detail}"
+        )
+
+    by_category = {}
+    for hit in hits:
+        by_category.setdefault(hit["category"], []).append(hit)
+
+    bullets = []
+    for category_hits in list(by_category.values())[:3]:
+        first = category_hits[0]
+        bullets.append(f"- {first['label']} ({_reference(first)})")
+
+    sections = [f"## {heading}"]
+    for category_hits in by_category.values():
+        sections.append(f"## {category_hits[0]['label']}")
+        for hit in category_hits:
+            sections.append(f"- {_reference(hit)}: \"{hit['excerpt']}\"")
+    return "\n".join(bullets), "\n".join(sections)
+
+
+def format_hits_for_prompt(hits: list[dict]) -> str:
+    """Point the model at the sections the scanner flagged"""
+    if not hits:
+        return "None flagged"
+    return "\n".join(f"- {hit['label']}: {_reference(hit)} ... {hit['excerpt']} ..." for hit in hits)
@@ -1,16 +1,134 @@
 from pymongo import MongoClient, ReturnDocument
 from pymongo.server_api import ServerApi
-from pymongo.errors import DuplicateKeyError, OperationFailure
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError, OperationFailure
 from bson.objectid import ObjectId
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
 from typing import Optional
+import threading
 
-load_dotenv()
+# The large markdown fields live in website_details (keyed by url) so the
+# websites documents behind the hot lookups stay small
+DETAIL_FIELDS = ("extended_message", "reviews_extended_message")
+# website_details is mostly prose, which zstd compresses well on disk
+DETAILS_STORAGE_ENGINE = {"wiredTiger": {"configString": "block_compressor=zstd"}}
+
+def split_details(document: dict) -> tuple[dict, dict]:
+    """Split a website document into its summary and detail fields"""
+    summary = {k: v for k, v in document.items() if k not in DETAIL_FIELDS}
+    details = {k: document[k] for k in DETAIL_FIELDS if k in document}
+    return summary, details
+
+def merge_details(document: dict, details: Optional[dict]) -> dict:
+    """Overlay website_details fields; unmigrated documents keep theirs inline"""
+    if details:
+        document.update({k: details[k] for k in DETAIL_FIELDS if k in details})
+    return document
+
+def format_document(document: dict, details: bool = True) -> dict:
+    """Ensure consistent document structure with default values"""
+    # Convert ObjectId to string
+    document["_id"] = str(document["_id"])
+
+    # Set defaults for legacy documents
+    defaults = {
+        "provisional": False,
+        "reviews_message": document.get("message", ""),
+    }
+    if details:
+        defaults["extended_message"] = document.get("message", "")
+        defaults["reviews_extended_message"] = document.get("extended_message", "")
+
+    # Apply defaults for missing fields
+    for field, default in defaults.items():
+        document.setdefault(field, default)
+
+    return document
+
+# Queries and documents shared by MongoDBManager and AsyncMongoDBManager,
+# so the two only differ in how they talk to MongoDB
+
+VERSION_COUNTER_FILTER = {"_id": "websites"}
+VERSION_COUNTER_UPDATE = {"$inc": {"seq": 1}}
+SIMILARITY_STATS_ID = "near_duplicates"
+INDEXED_POLICIES_QUERY = {"signature": {"$ne": None}}
+
+def website_document(
+    url: str,
+    message: str,
+    extended_message: str,
+    reviews_message: Optional[str],
+    reviews_extended_message: Optional[str],
+    version: int
+) -> tuple[dict, dict]:
+    """A new websites document and the fields that go to website_details"""
+    now = datetime.utcnow()
+    return split_details({
+        "url": url,
+        "message": message,
+        "extended_message": extended_message,
+        "reviews_message": reviews_message,
+        "reviews_extended_message": reviews_extended_message,
+        "created_at": now,
+        "updated_at": now,
+        "version": version
+    })
+
+def placeholder_replacement(url: str, document: dict) -> tuple[dict, dict]:
+    """
+    (filter, update) replacing a pipeline's placeholder with document. The
+    pipeline stores a placeholder while it runs, which is then finalized
+    without reviews; a full document supersedes either.
+    """
+    # insert_one may have added an _id, which must not be overwritten
+    fields = {k: v for k, v in document.items() if k != "_id"}
+    return (
+        {"url": url, "$or": [{"pending": True}, {"reviews_message": None}]},
+        {"$set": {**fields, "provisional": False}, "$unset": {"pending": ""}}
+    )
+
+def existence_query(url: str) -> dict:
+    """Placeholders of a pipeline still running don't count, so add_website replaces them"""
+    return {"url": url, "pending": {"$ne": True}}
+
+def details_update(details: dict) -> dict:
+    return {"$set": {**details, "updated_at": datetime.utcnow()}}
+
+def changes_query(since: int, settle_seconds: float) -> dict:
+    """
+    Websites inserted or updated after version `since`.
+
+    Versions are allocated just before each write, so a write can land
+    slightly after a later version. Documents younger than settle_seconds
+    are held back so a consumer's resume token never skips one. Pending
+    placeholders can still be discarded without a trace, so they are only
+    published once finalized (which assigns a new version).
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=settle_seconds)
+    return {"version": {"$gt": since}, "updated_at": {"$lte": cutoff}, "pending": {"$ne": True}}
+
+def similarity_stats(stats: Optional[dict], indexed_documents: int) -> dict:
+    """Lookups, hits and hit rate of the near-duplicate index"""
+    stats = stats or {}
+    lookups = stats.get("lookups", 0)
+    hits = stats.get("hits", 0)
+    return {
+        "lookups": lookups,
+        "hits": hits,
+        "hit_rate": hits / lookups if lookups else 0.0,
+        "indexed_documents": indexed_documents
+    }
+
+def _ttl_days(env_name: str, default: int) -> timedelta:
+    """TTL read at call time so values from .env apply"""
+    return timedelta(days=int(os.getenv(env_name, default)))
 
 class MongoDBManager:
     def __init__(self):
+        # Read .env on first connect rather than at import time
+        load_dotenv()
+
         # Create a new client and connect to the server
         self.client = MongoClient(os.getenv("MONGO_URI"), server_api=ServerApi('1'))
 
@@ -20,6 +138,15 @@ class MongoDBManager:
             print("Pinged your deployment. You successfully connected to MongoDB!")
             self.db = self.client["website_manager"]
             self.collection = self.db["websites"]
+            self.discovery = self.db["discovery"]
+            self.policy_documents = self.db["policy_documents"]
+            self.policy_index_stats = self.db["policy_index_stats"]
+            self.reviews = self.db["reviews"]
+            self.review_summaries = self.db["review_summaries"]
+            self.counters = self.db["counters"]
+            self.website_details = self.db["website_details"]
+            self.reanalysis_jobs = self.db["reanalysis_jobs"]
+            self.usage = self.db["usage"]
             self._create_indexes()
         except OperationFailure as e:
             print(f"Database connection failed: {e}")
@@ -28,12 +155,58 @@ class MongoDBManager:
     def _create_indexes(self):
         """Create required indexes"""
         try:
+            self._ensure_details_collection()
             self.collection.create_index([("url", 1)], unique=True)
+            # Change feed reads documents in version order
+            self.collection.create_index([("version", 1)])
+            self.discovery.create_index([("domain", 1)], unique=True)
+            # Mongo drops discovery entries once both parts have expired
+            self.discovery.create_index([("expires_at", 1)], expireAfterSeconds=0)
+            self.policy_documents.create_index([("url", 1)], unique=True)
+            self.policy_documents.create_index([("bands", 1)])
+            self.reviews.create_index([("domain", 1), ("review_id", 1)], unique=True)
+            self.review_summaries.create_index([("domain", 1)], unique=True)
+            # Top domains of a day by token use
+            self.usage.create_index([("day", 1), ("totals.tokens", -1)])
             print("Database indexes verified")
         except Exception as e:
             print(f"Index creation failed: {e}")
             raise
 
+    def _ensure_details_collection(self):
+        """Create website_details with zstd block compression (the default is snappy)"""
+        if self.db.list_collection_names(filter={"name": "website_details"}):
+            return
+        try:
+            self.db.create_collection("website_details", storageEngine=DETAILS_STORAGE_ENGINE)
+            print("Created website_details collection")
+        except CollectionInvalid:
+            pass  # Created by another process in the meantime
+
+    def _save_details(self, url: str, details: dict):
+        """Upsert the large fields of a website into website_details"""
+        if details:
+            self.website_details.update_one({"_id": url}, details_update(details), upsert=True)
+
+    def _attach_details(self, documents: list[dict]) -> list[dict]:
+        """Load website_details for a batch of website documents"""
+        urls = [doc["url"] for doc in documents]
+        if urls:
+            details = {d["_id"]: d for d in self.website_details.find({"_id": {"$in": urls}})}
+            for doc in documents:
+                merge_details(doc, details.get(doc["url"]))
+        return documents
+
+    def _next_version(self) -> int:
+        """Monotonic version for the websites change feed"""
+        counter = self.counters.find_one_and_update(
+            VERSION_COUNTER_FILTER,
+            VERSION_COUNTER_UPDATE,
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return counter["seq"]
+
     def add_website(
         self,
         url: str,
@@ -45,42 +218,120 @@ class MongoDBManager:
         """
         Add a website with security and review information
         """
-        document = {
-            "url": url,
-            "message": message,
-            "extended_message": extended_message,
-            "reviews_message": reviews_message,
-            "reviews_extended_message": reviews_extended_message,
-            "created_at": datetime.utcnow()
-        }
+        document, details = website_document(
+            url, message, extended_message, reviews_message, reviews_extended_message, self._next_version()
+        )
 
         try:
             result = self.collection.insert_one(document)
+            self._save_details(url, details)
             print(f"Inserted document with ID: {result.inserted_id}")
             return str(result.inserted_id)
         except DuplicateKeyError:
+            existing = self.collection.find_one_and_update(
+                *placeholder_replacement(url, document),
+                return_document=ReturnDocument.AFTER
+            )
+            if existing:
+                self._save_details(url, details)
+                print(f"Replaced pending document for {url}")
+                return str(existing["_id"])
             print(f"Duplicate URL detected: {url}")
             return None
         except Exception as e:
             print(f"Insert operation failed: {e}")
             raise
 
+    def save_provisional_website(self, url: str, message: str, extended_message: str) -> bool:
+        """
+        Store scanner results for a site that has no document yet, so they
+        can be served while the full analysis runs. Returns True if this
+        call created the placeholder.
+        """
+        now = datetime.utcnow()
+        try:
+            result = self.collection.update_one(
+                {"url": url},
+                {"$setOnInsert": {
+                    "url": url,
+                    "message": message,
+                    "reviews_message": None,
+                    "provisional": True,
+                    "pending": True,
+                    "created_at": now,
+                    "updated_at": now
+                }},
+                upsert=True
+            )
+            if result.upserted_id is not None:
+                # Versioned only once inserted, so a lost race doesn't use up a version
+                self.collection.update_one(
+                    {"_id": result.upserted_id},
+                    {"$set": {"version": self._next_version(), "updated_at": datetime.utcnow()}}
+                )
+                self._save_details(url, {
+                    "extended_message": extended_message,
+                    "reviews_extended_message": None
+                })
+                print(f"Stored provisional result for {url}")
+                return True
+            return False
+        except DuplicateKeyError:
+            return False
+        except Exception as e:
+            print(f"Provisional save failed: {e}")
+            raise
+
+    def finalize_provisional_website(self, url: str, message: str, extended_message: str):
+        """Replace a provisional summary with the model's analysis"""
+        try:
+            result = self.collection.update_one(
+                {"url": url, "provisional": True},
+                {
+                    "$set": {
+                        "message": message,
+                        "provisional": False,
+                        "updated_at": datetime.utcnow(),
+                        "version": self._next_version()
+                    },
+                    "$unset": {"pending": ""}
+                }
+            )
+            if result.matched_count:
+                self._save_details(url, {"extended_message": extended_message})
+        except Exception as e:
+            print(f"Provisional finalize failed: {e}")
+            raise
+
+    def discard_provisional_website(self, url: str):
+        """Remove a placeholder whose pipeline run failed"""
+        try:
+            result = self.collection.delete_one({"url": url, "pending": True})
+            if result.deleted_count:
+                self.website_details.delete_one({"_id": url})
+                print(f"Discarded provisional result for {url}")
+        except Exception as e:
+            print(f"Provisional discard failed: {e}")
+            raise
+
     def website_exists(self, url: str) -> bool:
-        """Check if a website exists in the database by URL"""
+        """Check if a website exists in the database by URL; see existence_query"""
         try:
-            count = self.collection.count_documents({"url": url}, limit=1)
+            count = self.collection.count_documents(existence_query(url), limit=1)
             print(f"Existence check for {url}: {bool(count)}")
             return bool(count)
         except Exception as e:
             print(f"Existence check failed: {e}")
             raise
 
-    def get_website(self, url: str) -> dict:
-        """Retrieve website with all message fields"""
+    def get_website(self, url: str, include_details: bool = True) -> dict:
+        """Retrieve a website; the extended messages only if include_details"""
         try:
             document = self.collection.find_one({"url": url})
             if document:
-                document = self._format_document(document)
+                if include_details:
+                    merge_details(document, self.website_details.find_one({"_id": url}))
+                document = format_document(document, details=include_details)
                 print(f"Retrieved document for {url}")
             else:
                 print(f"No document found for {url}")
@@ -91,21 +342,422 @@ class MongoDBManager:
 
     def _format_document(self, document: dict) -> dict:
         """Ensure consistent document structure with default values"""
-        # Convert ObjectId to string
-        document["_id"] = str(document["_id"])
+        return format_document(document)
+
+    def get_discovery(self, domain: str) -> Optional[dict]:
+        """
+        Return cached discovery for a domain. Expired parts come back as None:
+        {"links": [...] | None, "privacy_policy_url": str | None, "terms_url": str | None}
+        """
+        try:
+            document = self.discovery.find_one({"domain": domain})
+            if not document:
+                return None
+            now = datetime.utcnow()
+            links_fresh = document.get("links_expires_at", now) > now
+            urls_fresh = document.get("urls_expires_at", now) > now
+            return {
+                "links": document.get("links") if links_fresh else None,
+                "privacy_policy_url": document.get("privacy_policy_url") if urls_fresh else None,
+                "terms_url": document.get("terms_url") if urls_fresh else None
+            }
+        except Exception as e:
+            print(f"Discovery lookup failed: {e}")
+            raise
+
+    def save_discovery_links(self, domain: str, links: list[str]):
+        """Store the map_url link list for a domain"""
+        self._save_discovery(domain, {"links": links}, "links_expires_at", _ttl_days("DISCOVERY_LINKS_TTL_DAYS", 7))
+
+    def save_discovery_urls(self, domain: str, privacy_policy_url: str, terms_url: str):
+        """Store the chosen privacy policy / terms URLs for a domain"""
+        self._save_discovery(
+            domain,
+            {"privacy_policy_url": privacy_policy_url, "terms_url": terms_url},
+            "urls_expires_at",
+            _ttl_days("DISCOVERY_URLS_TTL_DAYS", 30)
+        )
+
+    def _save_discovery(self, domain: str, fields: dict, expiry_field: str, ttl: timedelta):
+        now = datetime.utcnow()
+        try:
+            document = self.discovery.find_one_and_update(
+                {"domain": domain},
+                {"$set": {**fields, expiry_field: now + ttl, "updated_at": now}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            # TTL index field tracks whichever part expires last
+            expires_at = max(
+                document.get("links_expires_at", now),
+                document.get("urls_expires_at", now)
+            )
+            self.discovery.update_one({"domain": domain}, {"$set": {"expires_at": expires_at}})
+        except Exception as e:
+            print(f"Discovery save failed: {e}")
+            raise
+
+    def invalidate_discovery_urls(self, domain: str):
+        """Forget stored policy URLs (e.g. one of them now 404s)"""
+        try:
+            self.discovery.update_one(
+                {"domain": domain},
+                {"$unset": {"privacy_policy_url": "", "terms_url": "", "urls_expires_at": ""}}
+            )
+            print(f"Invalidated discovered URLs for {domain}")
+        except Exception as e:
+            print(f"Discovery invalidation failed: {e}")
+            raise
+
+    def save_policy_document(
+        self,
+        url: str,
+        terms_markdown: str,
+        privacy_markdown: str,
+        signature: Optional[list[int]],
+        bands: list[str],
+        message: str,
+        extended_message: str,
+        reused_from: Optional[str] = None,
+        analysis_version: Optional[dict] = None
+    ):
+        """Store scraped policy text with its similarity signature and analysis"""
+        try:
+            self.policy_documents.update_one(
+                {"url": url},
+                {"$set": {
+                    "terms_markdown": terms_markdown,
+                    "privacy_markdown": privacy_markdown,
+                    "signature": signature,
+                    "bands": bands,
+                    "message": message,
+                    "extended_message": extended_message,
+                    "reused_from": reused_from,
+                    "analysis_version": analysis_version,
+                    "updated_at": datetime.utcnow()
+                }},
+                upsert=True
+            )
+        except Exception as e:
+            print(f"Policy document save failed: {e}")
+            raise
 
-        # Set defaults for legacy documents
-        defaults = {
-            "extended_message": document.get("message", ""),
-            "reviews_message": document.get("message", ""),
-            "reviews_extended_message": document.get("extended_message", "")
-        }
+    def find_policy_candidates(self, bands: list[str], exclude_url: Optional[str] = None) -> list[dict]:
+        """
+        Indexed policies sharing at least one LSH bucket, originals only.
+        exclude_url keeps a refreshed site from matching its own old analysis.
+        """
+        try:
+            return list(self.policy_documents.find(
+                {"bands": {"$in": bands}, "reused_from": None, "url": {"$ne": exclude_url}},
+                {"url": 1, "signature": 1, "message": 1, "extended_message": 1, "analysis_version": 1}
+            ))
+        except Exception as e:
+            print(f"Policy candidate lookup failed: {e}")
+            raise
 
-        # Apply defaults for missing fields
-        for field, default in defaults.items():
-            document.setdefault(field, default)
+    def record_similarity_lookup(self, hit: bool):
+        """Count near-duplicate lookups across all workers"""
+        try:
+            self.policy_index_stats.update_one(
+                {"_id": SIMILARITY_STATS_ID},
+                {"$inc": {"lookups": 1, "hits": 1 if hit else 0}},
+                upsert=True
+            )
+        except Exception as e:
+            print(f"Similarity stats update failed: {e}")
 
-        return document
+    def get_similarity_stats(self) -> dict:
+        """Lookups, hits and hit rate of the near-duplicate index"""
+        try:
+            return similarity_stats(
+                self.policy_index_stats.find_one({"_id": SIMILARITY_STATS_ID}),
+                self.policy_documents.count_documents(INDEXED_POLICIES_QUERY)
+            )
+        except Exception as e:
+            print(f"Similarity stats lookup failed: {e}")
+            raise
+
+    def save_reviews(self, domain: str, reviews: list[dict]) -> int:
+        """Store parsed review records, skipping ones already ingested"""
+        now = datetime.utcnow()
+        documents = [{**review, "domain": domain, "ingested_at": now} for review in reviews]
+        try:
+            result = self.reviews.insert_many(documents, ordered=False)
+            inserted = len(result.inserted_ids)
+        except BulkWriteError as e:
+            inserted = e.details.get("nInserted", 0)
+        print(f"Stored {inserted} new reviews for {domain}")
+        return inserted
+
+    def get_recent_review_ids(self, domain: str, limit: int = 200) -> set[str]:
+        """IDs of the most recently ingested reviews for a domain"""
+        try:
+            cursor = self.reviews.find({"domain": domain}, {"review_id": 1}).sort("_id", -1).limit(limit)
+            return {doc["review_id"] for doc in cursor}
+        except Exception as e:
+            print(f"Review id lookup failed: {e}")
+            raise
+
+    def get_reviews(self, domain: str) -> list[dict]:
+        """Rating and date of every stored review for a domain"""
+        try:
+            return list(self.reviews.find({"domain": domain}, {"_id": 0, "rating": 1, "date": 1}))
+        except Exception as e:
+            print(f"Review lookup failed: {e}")
+            raise
+
+    def get_review_summary(self, domain: str) -> Optional[dict]:
+        """Last generated review summary for a domain"""
+        try:
+            return self.review_summaries.find_one({"domain": domain}, {"_id": 0})
+        except Exception as e:
+            print(f"Review summary lookup failed: {e}")
+            raise
+
+    def get_review_records(self, domain: str, limit: int = 200) -> list[dict]:
+        """Most recent stored reviews for a domain, with their text"""
+        try:
+            cursor = self.reviews.find({"domain": domain}, {"_id": 0}).sort("date", -1).limit(limit)
+            return list(cursor)
+        except Exception as e:
+            print(f"Review lookup failed: {e}")
+            raise
+
+    def save_review_summary(self, domain: str, message: str, extended_message: str,
+                            analysis_version: Optional[dict] = None):
+        try:
+            self.review_summaries.update_one(
+                {"domain": domain},
+                {"$set": {
+                    "message": message,
+                    "extended_message": extended_message,
+                    "analysis_version": analysis_version,
+                    "updated_at": datetime.utcnow()
+                }},
+                upsert=True
+            )
+        except Exception as e:
+            print(f"Review summary save failed: {e}")
+            raise
+
+    def _analysis_collection(self, stage: str):
+        """Collection holding a stage's stored analyses, and its key field"""
+        if stage == "policy_analysis":
+            return self.policy_documents, "url"
+        return self.review_summaries, "domain"
+
+    def _outdated_query(self, prompt_version: str, models: set[str]) -> dict:
+        # Documents written before stamping have no analysis_version and match
+        return {"$or": [
+            {"analysis_version.prompt_version": {"$ne": prompt_version}},
+            {"analysis_version.model": {"$nin": sorted(models)}}
+        ]}
+
+    def find_outdated_analyses(self, stage: str, prompt_version: str, models: set[str],
+                               exclude: list[str] = (), limit: int = 500) -> list[dict]:
+        """Stored analyses not produced by prompt_version on one of models"""
+        collection, key = self._analysis_collection(stage)
+        query = {**self._outdated_query(prompt_version, models), key: {"$nin": list(exclude)}}
+        projection = {"_id": 0, key: 1}
+        if stage == "policy_analysis":
+            projection.update({"terms_markdown": 1, "privacy_markdown": 1})
+        try:
+            return list(collection.find(query, projection).limit(limit))
+        except Exception as e:
+            print(f"Outdated analysis lookup failed: {e}")
+            raise
+
+    def count_analyses(self, stage: str, prompt_version: str, models: set[str]) -> dict:
+        collection, _ = self._analysis_collection(stage)
+        try:
+            return {
+                "total": collection.count_documents({}),
+                "outdated": collection.count_documents(self._outdated_query(prompt_version, models))
+            }
+        except Exception as e:
+            print(f"Analysis count failed: {e}")
+            raise
+
+    def save_policy_reanalysis(self, url: str, message: str, extended_message: str, analysis_version: dict):
+        """Store a re-run policy analysis and publish it to the website"""
+        now = datetime.utcnow()
+        try:
+            self.policy_documents.update_one(
+                {"url": url},
+                {"$set": {
+                    "message": message,
+                    "extended_message": extended_message,
+                    "analysis_version": analysis_version,
+                    "reused_from": None,
+                    "updated_at": now
+                }}
+            )
+            # Also replaces clause scanner results served while the LLM budget was spent
+            result = self.collection.update_one(
+                {"url": url},
+                {
+                    "$set": {"message": message, "provisional": False, "updated_at": now, "version": self._next_version()},
+                    "$unset": {"pending": ""}
+                }
+            )
+            if result.matched_count:
+                self._save_details(url, {"extended_message": extended_message})
+        except Exception as e:
+            print(f"Policy reanalysis save failed: {e}")
+            raise
+
+    def save_reviews_reanalysis(self, domain: str, message: str, extended_message: str, analysis_version: dict):
+        """Store a re-run review summary and publish it to the website"""
+        try:
+            self.save_review_summary(domain, message, extended_message, analysis_version)
+            url = f"https://{domain}"
+            result = self.collection.update_one(
+                {"url": url, "pending": {"$ne": True}},
+                {"$set": {"reviews_message": message, "updated_at": datetime.utcnow(), "version": self._next_version()}}
+            )
+            if result.matched_count:
+                self._save_details(url, {"reviews_extended_message": extended_message})
+        except Exception as e:
+            print(f"Reviews reanalysis save failed: {e}")
+            raise
+
+    def save_reanalysis_job(self, job: dict):
+        try:
+            self.reanalysis_jobs.replace_one({"_id": job["_id"]}, job, upsert=True)
+        except Exception as e:
+            print(f"Reanalysis job save failed: {e}")
+            raise
+
+    def get_reanalysis_job(self, job_id: str) -> Optional[dict]:
+        return self.reanalysis_jobs.find_one({"_id": job_id})
+
+    def list_reanalysis_jobs(self, limit: int = 20) -> list[dict]:
+        return list(self.reanalysis_jobs.find({}, {"batches": 0}).sort("created_at", -1).limit(limit))
+
+    def record_usage(self, day: str, domain: str, endpoint: str, stages: dict, totals: dict):
+        """
+        Add one pipeline run's usage to the domain's and the day's ("*")
+        usage documents
+        """
+        inc = {f"totals.{field}": value for field, value in totals.items()}
+        for stage, values in stages.items():
+            inc.update({f"stages.{stage}.{field}": value for field, value in values.items()})
+        for field in ("runs", "tokens", "cost_usd", "firecrawl_credits"):
+            inc[f"endpoints.{endpoint}.{field}"] = totals[field]
+        try:
+            for key in (domain, "*"):
+                self.usage.update_one(
+                    {"_id": f"{day}:{key}"},
+                    {"$inc": inc, "$setOnInsert": {"day": day, "domain": key}},
+                    upsert=True
+                )
+        except Exception as e:
+            print(f"Usage update failed: {e}")
+            raise
+
+    def get_usage_totals(self, day: str, domain: str) -> tuple[dict, dict]:
+        """(day totals, domain totals) for budget checks"""
+        try:
+            documents = {
+                doc["_id"]: doc.get("totals", {})
+                for doc in self.usage.find({"_id": {"$in": [f"{day}:*", f"{day}:{domain}"]}}, {"totals": 1})
+            }
+            return documents.get(f"{day}:*", {}), documents.get(f"{day}:{domain}", {})
+        except Exception as e:
+            print(f"Usage lookup failed: {e}")
+            raise
+
+    def get_snapshot_state(self) -> tuple[int, int]:
+        """(highest version, website count); a snapshot with both is current"""
+        try:
+            latest = self.collection.find_one({}, {"version": 1}, sort=[("version", -1)])
+            return (latest or {}).get("version") or 0, self.collection.count_documents({})
+        except Exception as e:
+            print(f"Snapshot state lookup failed: {e}")
+            raise
+
+    def get_snapshot_rows(self) -> list[dict]:
+        """Short fields of every finished website (no provisional or pending placeholders)"""
+        try:
+            cursor = self.collection.find(
+                {"provisional": {"$ne": True}, "pending": {"$exists": False}},
+                {"url": 1, "message": 1, "reviews_message": 1}
+            )
+            return [format_document(doc, details=False) for doc in cursor]
+        except Exception as e:
+            print(f"Snapshot rows lookup failed: {e}")
+            raise
+
+    def get_changes(self, since: int, limit: int = 100, settle_seconds: float = 2.0) -> list[dict]:
+        """Websites changed after version `since`, oldest first; see changes_query"""
+        try:
+            cursor = self.collection.find(changes_query(since, settle_seconds)).sort("version", 1).limit(limit)
+            changes = [self._format_document(doc) for doc in self._attach_details(list(cursor))]
+            print(f"Retrieved {len(changes)} changes since version {since}")
+            return changes
+        except Exception as e:
+            print(f"Change feed query failed: {e}")
+            raise
+
+    def backfill_versions(self) -> int:
+        """Give documents written before the change feed a version"""
+        count = 0
+        try:
+            for document in self.collection.find({"version": {"$exists": False}}, {"_id": 1, "created_at": 1}):
+                self.collection.update_one(
+                    {"_id": document["_id"], "version": {"$exists": False}},
+                    {"$set": {
+                        "version": self._next_version(),
+                        "updated_at": document.get("created_at") or datetime.utcnow()
+                    }}
+                )
+                count += 1
+            print(f"Backfilled versions for {count} documents")
+            return count
+        except Exception as e:
+            print(f"Version backfill failed: {e}")
+            raise
+
+    def migrate_details(self) -> int:
+        """Move extended fields stored inline on older documents into website_details"""
+        count = 0
+        try:
+            query = {"$or": [{field: {"$exists": True}} for field in DETAIL_FIELDS]}
+            projection = {"url": 1, **{field: 1 for field in DETAIL_FIELDS}}
+            for document in self.collection.find(query, projection):
+                _, details = split_details(document)
+                # Anything already in website_details was written later
+                existing = self.website_details.find_one({"_id": document["url"]}) or {}
+                self._save_details(document["url"], {k: v for k, v in details.items() if k not in existing})
+                self.collection.update_one(
+                    {"_id": document["_id"]},
+                    {"$unset": {field: "" for field in DETAIL_FIELDS}}
+                )
+                count += 1
+            print(f"Moved details of {count} documents to website_details")
+            return count
+        except Exception as e:
+            print(f"Details migration failed: {e}")
+            raise
+
+    def storage_stats(self) -> dict:
+        """Data, on-disk, index and WiredTiger cache bytes of websites and website_details"""
+        stats = {}
+        for name in ("websites", "website_details"):
+            try:
+                raw = self.db.command("collStats", name)
+            except OperationFailure:
+                raw = {}
+            stats[name] = {
+                "count": raw.get("count", 0),
+                "avg_obj_size": raw.get("avgObjSize", 0),
+                "size_bytes": raw.get("size", 0),
+                "storage_bytes": raw.get("storageSize", 0),
+                "index_bytes": raw.get("totalIndexSize", 0),
+                "cache_bytes": raw.get("wiredTiger", {}).get("cache", {}).get("bytes currently in the cache", 0)
+            }
+        return stats
 
     def clear_collection(self) -> int:
         """
@@ -114,17 +766,20 @@ class MongoDBManager:
         """
         try:
             result = self.collection.delete_many({})
+            self.website_details.delete_many({})
             print(f"Cleared {result.deleted_count} documents from collection")
             return result.deleted_count
         except Exception as e:
             print(f"Collection clearance failed: {e}")
             raise
 
-    def get_all_websites(self) -> list[dict]:
+    def get_all_websites(self, include_details: bool = True) -> list[dict]:
         """Retrieve all websites with formatted messages"""
         try:
-            cursor = self.collection.find()
-            websites = [self._format_document(doc) for doc in cursor]
+            websites = list(self.collection.find())
+            if include_details:
+                self._attach_details(websites)
+            websites = [format_document(doc, details=include_details) for doc in websites]
             print(f"Retrieved {len(websites)} websites from database")
             return websites
         except Exception as e:
@@ -146,6 +801,29 @@ class MongoDBManager:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
 
+_shared_lock = threading.Lock()
+_shared_manager: Optional[MongoDBManager] = None
+
+def get_shared_manager() -> MongoDBManager:
+    """
+    Process-wide manager for pipeline code running in worker threads.
+    PyMongo clients are thread-safe, so one connection pool is shared
+    instead of connecting (and pinging) per request.
+    """
+    global _shared_manager
+    if _shared_manager is None:
+        with _shared_lock:
+            if _shared_manager is None:
+                _shared_manager = MongoDBManager()
+    return _shared_manager
+
+def close_shared_manager():
+    global _shared_manager
+    with _shared_lock:
+        if _shared_manager is not None:
+            _shared_manager.close()
+            _shared_manager = None
+
 # Updated usage example
 if __name__ == "__main__":
     db_manager = MongoDBManager()
@@ -0,0 +1,326 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from dotenv import load_dotenv
+from langchain_core.rate_limiters import BaseRateLimiter
+from resilience import BudgetExhausted, CircuitOpenError, call_upstream, is_retryable_error
+from usage import UsageBudgetExceeded, llm_allowed, record_llm, usage_level
+
+class TokenRateLimiter(BaseRateLimiter):
+    """At most tokens_per_minute acquisitions in any sliding 60 second window"""
+
+    def __init__(self, tokens_per_minute: int):
+        self.tokens_per_minute = tokens_per_minute
+        self._acquired = deque()
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float):
+        while self._acquired and now - self._acquired[0] >= 60:
+            self._acquired.popleft()
+
+    def remaining(self) -> int:
+        """Requests left in the current window"""
+        with self._lock:
+            self._prune(time.time())
+            return max(self.tokens_per_minute - len(self._acquired), 0)
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        while True:
+            with self._lock:
+                now = time.time()
+                self._prune(now)
+                if len(self._acquired) < self.tokens_per_minute:
+                    self._acquired.append(now)
+                    return True
+                if not blocking:
+                    return False
+                # Concurrent waiters re-check after sleeping, so none overshoots
+                wait = self._acquired[0] + 60 - now
+
+            time.sleep(wait)
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        return self.acquire(blocking=blocking)
+
+
+# Which model tier each pipeline stage runs on. Every stage defaults to the
+# fast tier, which on OpenAI is gpt-4o-mini, the model the pipelines have
+# always used. Opt a stage into the strong tier with e.g.
+# LLM_STAGE_POLICY_ANALYSIS=strong
+STAGE_TIERS = {
+    "classify_urls": "fast",
+    "speculative": "fast",
+    "policy_analysis": "fast",
+    "reviews_analysis": "fast",
+}
+
+# Provider kinds. Each API key becomes its own quota bucket; several keys can
+# be given comma separated in `keys_env`. Models can be overridden with
+# LLM_<KIND>_<TIER>_MODEL, e.g. LLM_OPENAI_STRONG_MODEL=gpt-4o-mini
+PROVIDER_KINDS = {
+    "openai": {
+        "keys_env": ("OPENAI_API_KEYS", "OPENAI_API_KEY_2"),
+        "base_url": None,
+        "models": {"fast": "gpt-4o-mini", "strong": "gpt-4o"},
+        "requests_per_minute": 2900,
+    },
+    "deepseek": {
+        "keys_env": ("DEEPSEEK_API_KEYS",),
+        "base_url": "https://api.deepseek.com/",
+        "models": {"strong": "deepseek-chat"},
+        "requests_per_minute": 600,
+    },
+    "groq": {
+        "keys_env": ("GROQ_API_KEYS", "GROQ_API_KEY"),
+        "base_url": None,
+        "models": {"fast": "llama-3.1-8b-instant", "strong": "llama-3.3-70b-versatile"},
+        "requests_per_minute": 30,
+    },
+}
+
+# Seconds a provider is skipped after a 429/5xx when no Retry-After is given
+FAILOVER_COOLDOWN_SECONDS = 30
+MAX_COMPLETION_TOKENS = 3000
+
+
+class Provider:
+    """One model on one API key, with its own latency and error counters"""
+
+    def __init__(self, kind: str, key_index: int, tier: str, model: str,
+                 api_key: str, base_url: Optional[str], rate_limiter: TokenRateLimiter, client=None):
+        self.kind = kind
+        self.name = f"{kind}#{key_index}:{model}"
+        # Circuit breakers are per key: one key's 429s shouldn't trip the others
+        self.upstream = f"llm:{kind}#{key_index}"
+        self.tier = tier
+        self.model = model
+        self.api_key = api_key
+        self.base_url = base_url
+        self.rate_limiter = rate_limiter
+        self.cooldown_until = 0.0
+        # A prebuilt chat model (e.g. the load-test stubs) skips get_client's construction
+        self._client = client
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.latencies = deque(maxlen=500)
+
+    def get_client(self):
+        """Build the chat model on first use"""
+        with self._lock:
+            if self._client is None:
+                if self.kind == "groq":
+                    from langchain_groq import ChatGroq
+                    self._client = ChatGroq(
+                        model=self.model,
+                        api_key=self.api_key,
+                        max_tokens=MAX_COMPLETION_TOKENS,
+                        timeout=llm_timeout(),
+                        max_retries=0,
+                        rate_limiter=self.rate_limiter
+                    )
+                else:
+                    from langchain_openai import ChatOpenAI
+                    self._client = ChatOpenAI(
+                        model=self.model,
+                        api_key=self.api_key,
+                        base_url=self.base_url,
+                        max_completion_tokens=MAX_COMPLETION_TOKENS,
+                        timeout=llm_timeout(),
+                        max_retries=0,
+                        rate_limiter=self.rate_limiter
+                    )
+            return self._client
+
+    def available(self) -> bool:
+        return time.time() >= self.cooldown_until
+
+    def record(self, latency: float, error: Optional[Exception] = None):
+        with self._lock:
+            self.calls += 1
+            self.latencies.append(latency)
+            if error is not None:
+                self.failures += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = sorted(self.latencies)
+        percentile = lambda p: round(latencies[min(int(p * len(latencies)), len(latencies) - 1)] * 1000, 1) if latencies else None
+        return {
+            "provider": self.name,
+            "tier": self.tier,
+            "calls": self.calls,
+            "failures": self.failures,
+            "remaining_quota": self.rate_limiter.remaining(),
+            "cooling_down": not self.available(),
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+        }
+
+
+class LLMPool:
+    def __init__(self, providers: list[Provider]):
+        self.providers = providers
+
+    @classmethod
+    def from_env(cls) -> "LLMPool":
+        load_dotenv()
+        providers = []
+        for kind, config in PROVIDER_KINDS.items():
+            for key_index, api_key in enumerate(provider_keys(kind)):
+                # Tiers on the same key share one quota bucket
+                limiter = TokenRateLimiter(tokens_per_minute=config["requests_per_minute"])
+                for tier in config["models"]:
+                    model = configured_model(kind, tier)
+                    providers.append(Provider(kind, key_index, tier, model, api_key, config["base_url"], limiter))
+        print(f"LLM pool configured with {len(providers)} providers")
+        return cls(providers)
+
+    def candidates(self, stage: str) -> list[Provider]:
+        """Providers for the stage's tier, most remaining quota first"""
+        matching = self._stage_providers(stage)
+        ready = [p for p in matching if p.available()]
+        cooling = [p for p in matching if not p.available()]
+        ready.sort(key=lambda p: p.rate_limiter.remaining(), reverse=True)
+        cooling.sort(key=lambda p: p.cooldown_until)
+        return ready + cooling
+
+    def _stage_providers(self, stage: str) -> list[Provider]:
+        tier = stage_tier(stage)
+        matching = [p for p in self.providers if p.tier == tier]
+        if not matching:
+            # e.g. only DeepSeek configured, which has no fast tier
+            matching = list(self.providers)
+        return matching
+
+    def stage_models(self, stage: str) -> set[str]:
+        """Models the current configuration would run stage on"""
+        return {p.model for p in self._stage_providers(stage)}
+
+    def invoke_structured(self, stage: str, schema, prompt):
+        """Run a structured-output call for stage, failing over on 429/5xx"""
+        return self.invoke_with_provider(stage, schema, prompt)[0]
+
+    def invoke_with_provider(self, stage: str, schema, prompt) -> tuple:
+        """invoke_structured, also returning the Provider that answered"""
+        if not llm_allowed():
+            raise UsageBudgetExceeded(f"LLM usage budget spent, {stage} skipped")
+        candidates = self.candidates(stage)
+        if not candidates:
+            raise RuntimeError("No LLM providers configured")
+
+        hedge_after = os.getenv("LLM_HEDGE_AFTER_SECONDS")
+        last_error = None
+        for provider in candidates:
+            started = time.perf_counter()
+            try:
+                result = call_upstream(
+                    provider.upstream,
+                    lambda provider=provider: _invoke_structured(provider, stage, schema, prompt),
+                    timeout=llm_timeout(),
+                    retries=int(os.getenv("LLM_RETRIES", "1")),
+                    hedge_after=float(hedge_after) if hedge_after else None
+                )
+            except BudgetExhausted:
+                raise
+            except CircuitOpenError as e:
+                print(f"Skipping {provider.name}: {e}")
+                last_error = e
+                continue
+            except Exception as e:
+                provider.record(time.perf_counter() - started, e)
+                if not is_retryable_error(e):
+                    raise
+                provider.cooldown_until = time.time() + retry_after_seconds(e)
+                print(f"LLM provider {provider.name} failed for {stage}, failing over: {e}")
+                last_error = e
+                continue
+            provider.record(time.perf_counter() - started)
+            return result["parsed"], provider
+        raise last_error
+
+    def stats(self) -> list[dict]:
+        return [p.stats() for p in self.providers]
+
+
+def _invoke_structured(provider: Provider, stage: str, schema, prompt) -> dict:
+    """
+    One structured-output call, accounted to stage whether or not it
+    succeeds; retries and hedges each run it. Unparseable output is raised
+    here, inside the resilience layer, so it counts as neutral for the
+    circuit breaker rather than as a success.
+    """
+    started = time.perf_counter()
+    try:
+        # include_raw keeps the AIMessage, whose usage_metadata has the token counts
+        result = provider.get_client().with_structured_output(schema, include_raw=True).invoke(prompt)
+    except Exception:
+        # Tokens of a failed request aren't reported; count the call
+        record_llm(stage, provider.model, None, time.perf_counter() - started)
+        raise
+    record_llm(stage, provider.model, getattr(result["raw"], "usage_metadata", None), time.perf_counter() - started)
+    if result.get("parsing_error") is not None:
+        raise result["parsing_error"]
+    return result
+
+
+def stage_tier(stage: str) -> str:
+    # Over the usage downgrade threshold every stage runs on the cheap tier
+    if usage_level() == "fast":
+        return "fast"
+    return os.getenv(f"LLM_STAGE_{stage.upper()}", STAGE_TIERS.get(stage, "fast"))
+
+
+def configured_model(kind: str, tier: str) -> str:
+    return os.getenv(f"LLM_{kind.upper()}_{tier.upper()}_MODEL", PROVIDER_KINDS[kind]["models"][tier])
+
+
+def provider_keys(kind: str) -> list[str]:
+    """API keys for a provider kind, from the first of its env vars that is set"""
+    for env_name in PROVIDER_KINDS[kind]["keys_env"]:
+        keys = [k.strip() for k in os.getenv(env_name, "").split(",") if k.strip()]
+        if keys:
+            return keys
+    return []
+
+
+def llm_timeout() -> float:
+    return float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+
+
+def retry_after_seconds(error: Exception) -> float:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return FAILOVER_COOLDOWN_SECONDS
+
+
+_pool_lock = threading.Lock()
+_pool: Optional[LLMPool] = None
+
+def get_pool() -> LLMPool:
+    """Return the process-wide provider pool, reading config on first call"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = LLMPool.from_env()
+    return _pool
+
+def set_pool(pool: LLMPool):
+    """Replace the process-wide pool (load-test stubs)"""
+    global _pool
+    with _pool_lock:
+        _pool = pool
+
+def invoke_structured(stage: str, schema, prompt):
+    return get_pool().invoke_structured(stage, schema, prompt)
+
+def invoke_structured_with_model(stage: str, schema, prompt) -> tuple:
+    """(response, model name) so stored analyses can be stamped with their model"""
+    response, provider = get_pool().invoke_with_provider(stage, schema, prompt)
+    return response, provider.model
@@ -0,0 +1,357 @@
+# loadtest.py
+"""
+Replay extension-shaped traffic against the API and find where it saturates.
+
+Each simulated tab event picks a domain from a Zipf distribution and a user.
+It then does what extension/background.js and content.js do: check_root_url
+the first time that user sees the domain, add_website if it isn't known, and
+sometimes get_warning + analyze-reviews together when the modal opens.
+Events arrive open-loop (Poisson) at each rate in --rates.
+
+By default the harness starts a throwaway local mongod and, for each worker
+count, `uvicorn --factory stubs:stubbed_app --workers N`, so Firecrawl and
+the LLM are simulated with STUB_*_LATENCY_MS latencies. Run from the
+backend directory:
+
+    python loadtest.py --profile steady --workers 1,2,4 --rates 5,10,20,40 --duration 60
+    python loadtest.py --base-url http://staging:8000 --rates 5,10   # existing deployment
+
+p50/p95/p99, error and 429 rates are printed per route and rate. A rate
+counts as saturated once errors or 429s pass --max-error-rate or the
+check_root_url p95 passes --slo-ms. Results are appended to --output as
+JSON lines.
+"""
+import argparse
+import asyncio
+import bisect
+import itertools
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Optional
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+PROFILES = {
+    # Mostly popular sites, a third of the catalogue already analyzed
+    "steady": {"domains": 5000, "zipf_s": 1.1, "users": 200, "modal_probability": 0.05, "seed_fraction": 0.3},
+    # New install wave: a long tail of sites nobody has analyzed yet
+    "cold": {"domains": 50000, "zipf_s": 0.8, "users": 1000, "modal_probability": 0.02, "seed_fraction": 0.01},
+    # A few very popular sites, users opening the modal often
+    "popular": {"domains": 1000, "zipf_s": 1.4, "users": 500, "modal_probability": 0.15, "seed_fraction": 0.8},
+}
+
+ROUTES = ("check_root_url", "add_website", "get_warning", "analyze-reviews")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def domain_name(rank: int) -> str:
+    return f"site{rank}.loadtest.example"
+
+
+def zipf_sampler(n: int, s: float, rng: random.Random):
+    """Draw domain ranks 1..n with P(k) proportional to 1 / k^s"""
+    cumulative = list(itertools.accumulate(1 / k ** s for k in range(1, n + 1)))
+    total = cumulative[-1]
+    return lambda: bisect.bisect_left(cumulative, rng.random() * total) + 1
+
+
+def percentile(sorted_values: list[float], p: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    return round(sorted_values[min(int(p * len(sorted_values)), len(sorted_values) - 1)], 1)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {route: [] for route in ROUTES}
+        self.statuses = {route: {} for route in ROUTES}
+
+    def add(self, route: str, status: int, latency_ms: float):
+        self.latencies[route].append(latency_ms)
+        self.statuses[route][status] = self.statuses[route].get(status, 0) + 1
+
+    def summary(self, duration: float) -> dict:
+        routes = {}
+        for route in ROUTES:
+            latencies = sorted(self.latencies[route])
+            count = len(latencies)
+            if not count:
+                continue
+            statuses = self.statuses[route]
+            # 0 is a client-side timeout or connection error
+            errors = sum(n for code, n in statuses.items() if code == 0 or code >= 500)
+            routes[route] = {
+                "count": count,
+                "rps": round(count / duration, 2),
+                "p50_ms": percentile(latencies, 0.50),
+                "p95_ms": percentile(latencies, 0.95),
+                "p99_ms": percentile(latencies, 0.99),
+                "error_rate": round(errors / count, 4),
+                "rejected_rate": round(statuses.get(429, 0) / count, 4),
+            }
+        return routes
+
+
+async def timed(client: httpx.AsyncClient, recorder: Recorder, route: str, method: str, path: str, **kwargs):
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, path, **kwargs)
+        status = response.status_code
+    except httpx.HTTPError:
+        response, status = None, 0
+    recorder.add(route, status, (time.perf_counter() - started) * 1000)
+    return response
+
+
+async def tab_event(client, recorder: Recorder, checked: set, domain: str, open_modal: bool):
+    """One tab switch to domain, as background.js and content.js handle it"""
+    if domain not in checked:
+        checked.add(domain)
+        response = await timed(client, recorder, "check_root_url", "GET", f"/check_root_url/{domain}")
+        if response is not None and response.status_code == 200 and not response.json().get("exists"):
+            await timed(client, recorder, "add_website", "POST", "/add_website", json={"website": domain})
+    if open_modal:
+        await asyncio.gather(
+            timed(client, recorder, "get_warning", "GET", f"/get_warning/{domain}"),
+            timed(client, recorder, "analyze-reviews", "GET", f"/analyze-reviews/{domain}")
+        )
+
+
+async def replay(base_url: str, profile: dict, rate: float, duration: float, timeout: float, seed: int) -> dict:
+    """Offer tab events at `rate` per second for `duration` seconds, then wait for stragglers"""
+    rng = random.Random(seed)
+    sample_rank = zipf_sampler(profile["domains"], profile["zipf_s"], rng)
+    checked = [set() for _ in range(profile["users"])]
+    recorder = Recorder()
+    tasks = set()
+
+    limits = httpx.Limits(max_connections=2000, max_keepalive_connections=200)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        started = time.perf_counter()
+        next_at = 0.0
+        events = 0
+        # How far behind schedule events fired; grows when the client is the bottleneck
+        schedule_lag = 0.0
+        while True:
+            next_at += rng.expovariate(rate)
+            if next_at >= duration:
+                break
+            await asyncio.sleep(max(0.0, next_at - (time.perf_counter() - started)))
+            schedule_lag = max(schedule_lag, time.perf_counter() - started - next_at)
+            task = asyncio.create_task(tab_event(
+                client, recorder,
+                checked[rng.randrange(profile["users"])],
+                domain_name(sample_rank()),
+                rng.random() < profile["modal_probability"]
+            ))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            events += 1
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+        elapsed = time.perf_counter() - started
+
+    return {
+        "offered_events_per_s": rate,
+        "events": events,
+        "elapsed_s": round(elapsed, 1),
+        "schedule_lag_s": round(schedule_lag, 2),
+        "unfinished": len(tasks),
+        "routes": recorder.summary(duration)
+    }
+
+
+def is_saturated(step: dict, slo_ms: float, max_error_rate: float) -> bool:
+    routes = step["routes"]
+    if step["unfinished"]:
+        return True
+    if any(r["error_rate"] + r["rejected_rate"] > max_error_rate for r in routes.values()):
+        return True
+    check = routes.get("check_root_url")
+    return bool(check and check["p95_ms"] is not None and check["p95_ms"] > slo_ms)
+
+
+def start_local_mongo() -> tuple[subprocess.Popen, str, str]:
+    """Throwaway mongod on a free port with its data in a temp directory"""
+    from pymongo import MongoClient
+
+    mongod = shutil.which("mongod")
+    if not mongod:
+        raise SystemExit("mongod not found on PATH; install MongoDB or pass --mongo-uri")
+    dbpath = tempfile.mkdtemp(prefix="loadtest-mongo-")
+    port = _free_port()
+    proc = subprocess.Popen(
+        [mongod, "--dbpath", dbpath, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    uri = f"mongodb://127.0.0.1:{port}/"
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            MongoClient(uri, serverSelectionTimeoutMS=500).admin.command("ping")
+            return proc, uri, dbpath
+        except Exception:
+            if proc.poll() is not None or time.monotonic() > deadline:
+                proc.kill()
+                shutil.rmtree(dbpath, ignore_errors=True)
+                raise SystemExit("local mongod did not start")
+            time.sleep(0.2)
+
+
+def reset_database(mongo_uri: str, profile: dict):
+    """Empty website_manager and mark the most popular seed_fraction of domains as analyzed"""
+    from pymongo import MongoClient
+
+    MongoClient(mongo_uri).drop_database("website_manager")
+    os.environ["MONGO_URI"] = mongo_uri
+    from database import MongoDBManager
+
+    seeded = int(profile["domains"] * profile["seed_fraction"])
+    with MongoDBManager() as db:
+        for rank in range(1, seeded + 1):
+            db.add_website(
+                url=f"https://{domain_name(rank)}",
+                message="- Seeded issue one\n- Seeded issue two\n- Seeded issue three",
+                extended_message="## Seeded analysis",
+                reviews_message=None,
+                reviews_extended_message=None
+            )
+    print(f"Seeded {seeded} analyzed domains")
+
+
+def start_api(workers: int, mongo_uri: str) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    env = {**os.environ, "MONGO_URI": mongo_uri}
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "--factory", "stubs:stubbed_app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit("API exited during start-up")
+        try:
+            httpx.get(f"{base_url}/admission/stats", timeout=1)
+            return proc, base_url
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit("API did not start")
+
+
+def stop(proc: subprocess.Popen):
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def print_step(workers, step: dict, saturated: bool):
+    flag = "  SATURATED" if saturated else ""
+    print(f"\nworkers={workers} rate={step['offered_events_per_s']}/s events={step['events']} "
+          f"lag={step['schedule_lag_s']}s unfinished={step['unfinished']}{flag}")
+    print(f"  {'route':<16}{'count':>7}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'err':>7}{'429':>7}")
+    for route, r in step["routes"].items():
+        print(f"  {route:<16}{r['count']:>7}{r['rps']:>8}{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}"
+              f"{r['error_rate']:>7.1%}{r['rejected_rate']:>7.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the API with extension-shaped traffic")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="steady")
+    parser.add_argument("--profile-file", help="JSON object overriding profile fields")
+    parser.add_argument("--workers", default="1,2,4", help="uvicorn worker counts to compare")
+    parser.add_argument("--rates", default="5,10,20,40", help="Tab events per second, stepped up in order")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds per rate step")
+    parser.add_argument("--timeout", type=float, default=45, help="Per-request timeout, as the extension uses")
+    parser.add_argument("--slo-ms", type=float, default=300, help="check_root_url p95 that counts as saturated")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--base-url", help="Test an existing deployment instead of starting one")
+    parser.add_argument("--mongo-uri", help="Use this MongoDB instead of a throwaway local mongod")
+    parser.add_argument("--reset-db", action="store_true",
+                        help="Drop and re-seed website_manager on --mongo-uri before each worker count")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Append results as a JSON line to this file")
+    args = parser.parse_args()
+
+    profile = dict(PROFILES[args.profile])
+    if args.profile_file:
+        with open(args.profile_file) as f:
+            profile.update(json.load(f))
+    rates = [float(r) for r in args.rates.split(",")]
+
+    results = {
+        "profile": profile,
+        "timestamp": datetime.utcnow().isoformat(),
+        "stub_latency_ms": {
+            "firecrawl": os.getenv("STUB_FIRECRAWL_LATENCY_MS", "1500"),
+            "llm": os.getenv("STUB_LLM_LATENCY_MS", "4000")
+        },
+        "runs": []
+    }
+
+    def sweep(workers, base_url: str) -> Optional[float]:
+        """Step through the rates; returns the first saturated rate"""
+        for rate in rates:
+            step = asyncio.run(replay(base_url, profile, rate, args.duration, args.timeout, args.seed))
+            saturated = is_saturated(step, args.slo_ms, args.max_error_rate)
+            print_step(workers, step, saturated)
+            results["runs"].append({"workers": workers, **step, "saturated": saturated})
+            if saturated:
+                return rate
+        return None
+
+    saturation = {}
+    if args.base_url:
+        saturation["external"] = sweep("external", args.base_url.rstrip("/"))
+    else:
+        mongo = None
+        mongo_uri = args.mongo_uri
+        if not mongo_uri:
+            mongo = start_local_mongo()
+            mongo_uri = mongo[1]
+        try:
+            for workers in [int(w) for w in args.workers.split(",")]:
+                # Never drop a database the harness didn't start unless asked to
+                if mongo or args.reset_db:
+                    reset_database(mongo_uri, profile)
+                api, base_url = start_api(workers, mongo_uri)
+                try:
+                    saturation[workers] = sweep(workers, base_url)
+                finally:
+                    stop(api)
+        finally:
+            if mongo:
+                stop(mongo[0])
+                shutil.rmtree(mongo[2], ignore_errors=True)
+
+    results["saturation"] = {str(k): v for k, v in saturation.items()}
+    print("\nSaturation (tab events/s):")
+    for workers, rate in saturation.items():
+        print(f"  workers={workers}: {rate if rate is not None else f'> {rates[-1]}'}")
+
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(results) + "\n")
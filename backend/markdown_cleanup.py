@@ -0,0 +1,218 @@
+# markdown_cleanup.py
+"""
+Strip boilerplate from scraped markdown before it goes into a prompt.
+
+Lines are processed as a stream: images are dropped, links collapse to their
+text, navigation link lists and consent buttons are removed, repeated blocks
+are kept once, and output stops at a token budget. Cookie banner and footer
+blocks are only removed before the body starts or at the end of the page;
+a policy's own sentences about cookies are never dropped.
+
+Measure prompt shrinkage over a folder of scraped pages with:
+
+    python markdown_cleanup.py fixtures/*.md --budget 12000
+"""
+import hashlib
+import re
+from functools import lru_cache
+from typing import Iterable, Iterator, Optional
+
+_IMAGE_RE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+_IMAGE_URL_RE = re.compile(r"\S+\.(?:png|jpe?g|gif|svg|webp)(?:\?\S*)?", re.IGNORECASE)
+_LINK_RE = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+_BARE_URL_RE = re.compile(r"<?https?://\S+>?")
+_LIST_MARKER_RE = re.compile(r"^\s*(?:[-*+]|\d+\.)\s+")
+_COOKIE_RE = re.compile(
+    r"\b(?:we use cookies|this (?:site|website) uses cookies|accept all|reject all|"
+    r"cookie (?:settings|preferences|policy)|manage (?:cookies|preferences))\b",
+    re.IGNORECASE,
+)
+_FOOTER_RE = re.compile(r"(?:©|\(c\)|copyright \d{4}|all rights reserved)", re.IGNORECASE)
+# Consent banner buttons; a line of nothing else is dropped anywhere
+_BUTTON_RE = re.compile(
+    r"\b(?:accept(?: all)?(?: cookies)?|reject(?: all)?|decline|allow all|got it|ok(?:ay)?|"
+    r"cookie (?:settings|preferences)|manage (?:cookies|preferences))\b",
+    re.IGNORECASE,
+)
+# Lines of a banner or footer block besides the matching one (links, short labels)
+BOILERPLATE_LINE_CHARS = 60
+# A heading or a line this long means the page body has started
+BODY_LINE_CHARS = 200
+# Short lines that are only links are navigation; this many in a row is a menu
+NAV_RUN_LENGTH = 3
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    """tiktoken encoding if installed, else None (falls back to chars / 4)"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def _is_link_only(line: str) -> bool:
+    """A line whose content is nothing but links (menu entries, link lists)"""
+    stripped = _LIST_MARKER_RE.sub("", line).strip()
+    if not stripped or not _LINK_RE.search(stripped):
+        return False
+    remainder = _LINK_RE.sub("", stripped)
+    return len(re.sub(r"[\s|•·,/-]+", "", remainder)) <= 3
+
+
+def _clean_line(line: str) -> str:
+    line = _IMAGE_RE.sub("", line)
+    line = _LINK_RE.sub(lambda m: m.group(1).strip(), line)
+    line = _BARE_URL_RE.sub("", line)
+    line = _IMAGE_URL_RE.sub("", line)
+    return line.rstrip()
+
+
+def _is_button_line(line: str) -> bool:
+    """A line that is only consent buttons, e.g. "Accept all | Reject all" """
+    if not _BUTTON_RE.search(line):
+        return False
+    return len(re.sub(r"[\s|•·,/-]+", "", _BUTTON_RE.sub("", line))) <= 3
+
+
+def _is_boilerplate(block: list[str]) -> bool:
+    """A cookie banner or footer: a short banner/footer line plus only short lines"""
+    if not any(len(line) < 300 and (_COOKIE_RE.search(line) or _FOOTER_RE.search(line)) for line in block):
+        return False
+    return all(
+        len(line) <= BOILERPLATE_LINE_CHARS or (len(line) < 300 and (_COOKIE_RE.search(line) or _FOOTER_RE.search(line)))
+        for line in block
+    )
+
+
+def _starts_body(block: list[str]) -> bool:
+    return any(line.lstrip().startswith("#") or len(line) >= BODY_LINE_CHARS for line in block)
+
+
+def _line_blocks(lines: Iterable[str], stats: dict) -> Iterator[list[str]]:
+    """Group lines into blank-line separated blocks, dropping nav runs and button lines"""
+    block = []
+    link_run = []
+    for raw in lines:
+        if _is_link_only(raw):
+            link_run.append(raw)
+            continue
+        if link_run:
+            if len(link_run) < NAV_RUN_LENGTH:
+                block.extend(_clean_line(l) for l in link_run)
+            else:
+                stats["removed_lines"] += len(link_run)
+            link_run = []
+
+        line = _clean_line(raw)
+        if not line.strip():
+            if block:
+                yield block
+                block = []
+            continue
+        if _is_button_line(line):
+            stats["removed_lines"] += 1
+            continue
+        block.append(line)
+
+    if link_run and len(link_run) < NAV_RUN_LENGTH:
+        block.extend(_clean_line(l) for l in link_run)
+    elif link_run:
+        stats["removed_lines"] += len(link_run)
+    if block:
+        yield block
+
+
+def _blocks(lines: Iterable[str], stats: dict) -> Iterator[list[str]]:
+    """
+    Blocks of the page without leading and trailing banners and footers.
+    Banner-like blocks after the body starts (and short blocks after them,
+    such as footer links) are held back and only dropped if nothing else
+    follows.
+    """
+    body_started = False
+    held = []
+    for block in _line_blocks(lines, stats):
+        short = all(len(line) <= BOILERPLATE_LINE_CHARS and not line.lstrip().startswith("#") for line in block)
+        if _is_boilerplate(block) or (held and short):
+            if body_started:
+                held.append(block)
+            else:
+                stats["removed_lines"] += len(block)
+            continue
+        yield from held
+        held = []
+        body_started = body_started or _starts_body(block)
+        yield block
+    stats["removed_lines"] += sum(len(block) for block in held)
+
+
+def iter_clean_markdown(lines: Iterable[str], token_budget: Optional[int], stats: dict) -> Iterator[str]:
+    """Yield cleaned blocks from a stream of lines until the token budget is spent"""
+    seen = set()
+    used = 0
+    for block in _blocks(lines, stats):
+        text = "\n".join(block)
+        key = hashlib.blake2b(re.sub(r"\W+", " ", text.lower()).strip().encode(), digest_size=8).digest()
+        if key in seen:
+            stats["duplicate_blocks"] += 1
+            continue
+        seen.add(key)
+
+        tokens = count_tokens(text)
+        if token_budget is not None and used + tokens > token_budget:
+            stats["truncated"] = True
+            remaining_chars = max((token_budget - used) * 4, 0)
+            if remaining_chars > 200:
+                yield text[:remaining_chars].rsplit(" ", 1)[0] + " [truncated]"
+            return
+        used += tokens
+        yield text
+
+
+def clean_markdown(markdown: Optional[str], token_budget: Optional[int] = None) -> tuple[str, dict]:
+    """
+    Clean scraped markdown for a prompt.
+
+    Returns:
+        (cleaned_markdown, report) where report has tokens_before, tokens_after,
+        removed_lines, duplicate_blocks and truncated
+    """
+    markdown = markdown or ""
+    stats = {"removed_lines": 0, "duplicate_blocks": 0, "truncated": False}
+    cleaned = "\n\n".join(iter_clean_markdown(markdown.splitlines(), token_budget, stats))
+    report = {
+        "tokens_before": count_tokens(markdown),
+        "tokens_after": count_tokens(cleaned),
+        **stats
+    }
+    return cleaned, report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Report prompt token savings from markdown cleanup")
+    parser.add_argument("paths", nargs="+", help="Scraped markdown files")
+    parser.add_argument("--budget", type=int, default=None, help="Token budget per document")
+    args = parser.parse_args()
+
+    total_before = total_after = 0
+    print(f"{'document':<50} {'before':>8} {'after':>8} {'saved':>7}")
+    for path in args.paths:
+        with open(path, encoding="utf-8") as f:
+            _, report = clean_markdown(f.read(), args.budget)
+        total_before += report["tokens_before"]
+        total_after += report["tokens_after"]
+        saved = 1 - report["tokens_after"] / report["tokens_before"] if report["tokens_before"] else 0
+        print(f"{path[-50:]:<50} {report['tokens_before']:>8} {report['tokens_after']:>8} {saved:>6.0%}")
+    if total_before:
+        print(f"{'TOTAL':<50} {total_before:>8} {total_after:>8} {1 - total_after / total_before:>6.0%}")
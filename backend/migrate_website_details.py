@@ -0,0 +1,59 @@
+# migrate_website_details.py
+"""
+Move extended_message / reviews_extended_message out of existing websites
+documents into the zstd-compressed website_details collection, and report
+storage and cache footprint before and after.
+
+    python migrate_website_details.py [--compact]
+
+storage_bytes only shrinks once WiredTiger reclaims the freed space, which
+--compact forces (needs a dedicated Atlas tier or a self-managed server).
+cache_bytes reflects recent traffic, so compare it after the app has served
+its usual lookups for a while.
+"""
+import argparse
+
+from database import MongoDBManager
+
+STAT_FIELDS = ("count", "avg_obj_size", "size_bytes", "storage_bytes", "index_bytes", "cache_bytes")
+
+
+def print_stats(label: str, stats: dict):
+    print(f"\n{label}")
+    print(f"{'collection':<18}" + "".join(f"{field:>15}" for field in STAT_FIELDS))
+    for name, values in stats.items():
+        print(f"{name:<18}" + "".join(f"{values[field]:>15,}" for field in STAT_FIELDS))
+
+
+def migrate(compact: bool = False):
+    try:
+        with MongoDBManager() as db:
+            before = db.storage_stats()
+            print_stats("Before", before)
+
+            count = db.migrate_details()
+            if compact:
+                for name in ("websites", "website_details"):
+                    try:
+                        db.db.command("compact", name)
+                        print(f"Compacted {name}")
+                    except Exception as e:
+                        print(f"Compact of {name} failed: {e}")
+
+            after = db.storage_stats()
+            print_stats("After", after)
+
+            hot_before = before["websites"]["size_bytes"]
+            hot_after = after["websites"]["size_bytes"]
+            if hot_before:
+                print(f"\nMigrated {count} documents; websites data shrank "
+                      f"{hot_before:,} -> {hot_after:,} bytes ({1 - hot_after / hot_before:.0%})")
+    except Exception as e:
+        print(f"Error migrating website details: {str(e)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split large analysis fields into website_details")
+    parser.add_argument("--compact", action="store_true", help="Run compact afterwards to release disk space")
+    args = parser.parse_args()
+    migrate(args.compact)
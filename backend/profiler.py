@@ -0,0 +1,160 @@
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional
+
+from dotenv import load_dotenv
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_SUFFIX = ".folded"
+
+
+def _is_idle(stack: list[str]) -> bool:
+    """Executor/anyio worker threads parked waiting for work (innermost first)"""
+    if stack[0] == "thread.py:_worker":
+        return True
+    return stack[:2] == ["threading.py:wait", "queue.py:get"]
+
+
+@lru_cache(maxsize=1)
+def profiler_config() -> dict:
+    """
+    Profiling is off unless PROFILER_ENABLED is set. Then a request is
+    profiled if it sends `X-Profile: 1` or falls in PROFILER_SAMPLE_RATE.
+    """
+    load_dotenv()
+    return {
+        "enabled": os.getenv("PROFILER_ENABLED", "").lower() in ("1", "true", "yes"),
+        "sample_rate": float(os.getenv("PROFILER_SAMPLE_RATE", "0")),
+        "interval": float(os.getenv("PROFILER_INTERVAL_MS", "5")) / 1000,
+        "directory": os.getenv("PROFILER_DIR", "profiles"),
+    }
+
+
+def should_profile(headers) -> bool:
+    config = profiler_config()
+    if not config["enabled"]:
+        return False
+    if headers.get(PROFILE_HEADER, "").lower() in ("1", "true", "yes"):
+        return True
+    return config["sample_rate"] > 0 and random.random() < config["sample_rate"]
+
+
+class SamplingProfiler:
+    """
+    Samples every thread's Python stack at a fixed interval from a background
+    thread, so the profiled code runs uninstrumented. Stacks from the event
+    loop and the worker threads are both captured; each is rooted at its
+    thread name. Other requests in flight at the same time show up too.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if not stack or _is_idle(stack):
+                    continue
+                stack.append(names.get(thread_id, str(thread_id)).replace(";", "_"))
+                self.samples[";".join(reversed(stack))] += 1
+
+
+def _slug(text: str, limit: int = 60) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "-", text).strip("-")[:limit] or "root"
+
+
+def write_profile(route: str, path: str, duration: float, samples: Counter) -> Optional[str]:
+    """Write samples in collapsed-stack format (flamegraph.pl, speedscope, inferno)"""
+    if not samples:
+        return None
+    directory = profiler_config()["directory"]
+    os.makedirs(directory, exist_ok=True)
+    filename = (
+        f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}"
+        f"__{_slug(route)}__{_slug(path)}__{int(duration * 1000)}ms{PROFILE_SUFFIX}"
+    )
+    file_path = os.path.join(directory, filename)
+    with open(file_path, "w") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+    print(f"Wrote profile {file_path}")
+    return file_path
+
+
+def list_profiles(limit: int = 50) -> list[dict]:
+    """Most recent profiles first, with route, path and duration from the filename"""
+    directory = profiler_config()["directory"]
+    if not os.path.isdir(directory):
+        return []
+    names = sorted((n for n in os.listdir(directory) if n.endswith(PROFILE_SUFFIX)), reverse=True)
+    profiles = []
+    for name in names[:limit]:
+        parts = name[:-len(PROFILE_SUFFIX)].split("__")
+        if len(parts) != 4:
+            continue
+        timestamp, route, path, duration = parts
+        profiles.append({
+            "file": name,
+            "created_at": datetime.strptime(timestamp, "%Y%m%dT%H%M%S%f").isoformat(),
+            "route": route,
+            "path": path,
+            "duration_ms": int(duration.removesuffix("ms")),
+            "size_bytes": os.path.getsize(os.path.join(directory, name))
+        })
+    return profiles
+
+
+def profile_path(name: str) -> Optional[str]:
+    """Path of a listed profile, or None (also rejects anything path-like)"""
+    if name != os.path.basename(name) or not name.endswith(PROFILE_SUFFIX):
+        return None
+    path = os.path.join(profiler_config()["directory"], name)
+    return path if os.path.isfile(path) else None
+
+
+async def profile_request(request, call_next):
+    """HTTP middleware: profile the request if asked to, otherwise pass through"""
+    if not should_profile(request.headers):
+        return await call_next(request)
+
+    profiler = SamplingProfiler(profiler_config()["interval"])
+    profiler.start()
+    started = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        duration = time.perf_counter() - started
+        samples = profiler.stop()
+        endpoint = request.scope.get("endpoint")
+        route = getattr(endpoint, "__name__", "unknown")
+        try:
+            write_profile(route, request.url.path, duration, samples)
+        except OSError as e:
+            print(f"Failed to write profile: {e}")
@@ -0,0 +1,386 @@
+# reanalysis.py
+"""
+Re-run the LLM stage of stored analyses whose prompt or model is out of date.
+
+Policy analyses are rebuilt from the cleaned policy text cached in
+policy_documents and review summaries from the stored review records, so
+nothing is re-crawled. Work goes out in batches through a BatchBackend and
+the job's progress is kept in reanalysis_jobs, so an interrupted run picks
+up where it stopped.
+
+    python reanalysis.py status
+    python reanalysis.py run --stage policy_analysis --backend openai --batch-size 500 --max-in-flight 2
+    python reanalysis.py resume <job_id>
+    python reanalysis.py report [job_id]
+"""
+import argparse
+import json
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from clause_scanner import scan_policies
+from database import MongoDBManager
+from llm_pool import (MAX_COMPLETION_TOKENS, configured_model, get_pool, invoke_structured_with_model,
+                      provider_keys, stage_tier)
+from reviews import compute_review_stats
+from web_scraper import (PROMPT_VERSIONS, Default_Return_Schema, analysis_version, build_policy_prompt,
+                         build_reviews_prompt)
+
+STAGES = ("policy_analysis", "reviews_analysis")
+# Reviews sent to the model when a summary is rebuilt from scratch
+REANALYSIS_REVIEW_LIMIT = 200
+# Batches a key may be submitted in before a job gives up on it
+MAX_ATTEMPTS = 3
+
+
+class BatchBackend(ABC):
+    """
+    Submits many prompts as one unit of work and collects their results later.
+    Results map each request's custom_id to {message, extended_message, model}
+    or {error}.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def submit(self, stage: str, requests: list[dict]) -> str:
+        pass
+
+    @abstractmethod
+    def poll(self, batch_id: str) -> str:
+        """"in_progress", "completed", "failed" or "lost" (unknown to this backend)"""
+
+    @abstractmethod
+    def results(self, stage: str, batch_id: str) -> dict[str, dict]:
+        pass
+
+
+class LocalBatchBackend(BatchBackend):
+    """
+    Runs each batch through the live provider pool in-process, `concurrency`
+    calls at a time. Stand-in for the Batch API in tests and small runs;
+    batches don't survive the process, so resumed jobs resubmit them.
+    """
+
+    name = "local"
+
+    def __init__(self, concurrency: int = 4):
+        self.concurrency = concurrency
+        self._results = {}
+
+    def _run(self, stage: str, request: dict) -> dict:
+        try:
+            response, model = invoke_structured_with_model(stage, Default_Return_Schema, request["prompt"])
+            return {"message": response.message, "extended_message": response.extended_message, "model": model}
+        except Exception as e:
+            return {"error": str(e)}
+
+    def submit(self, stage: str, requests: list[dict]) -> str:
+        batch_id = f"local-{uuid.uuid4().hex[:12]}"
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            outputs = pool.map(lambda request: (request["custom_id"], self._run(stage, request)), requests)
+            self._results[batch_id] = dict(outputs)
+        return batch_id
+
+    def poll(self, batch_id: str) -> str:
+        return "completed" if batch_id in self._results else "lost"
+
+    def results(self, stage: str, batch_id: str) -> dict[str, dict]:
+        return self._results.pop(batch_id)
+
+
+class OpenAIBatchBackend(BatchBackend):
+    """
+    OpenAI Batch API: requests are uploaded as a JSONL file and processed
+    within 24 hours at half the synchronous price, outside the per-minute
+    quota the live pipelines use.
+    """
+
+    name = "openai"
+
+    def __init__(self):
+        from openai import OpenAI
+        load_dotenv()
+        keys = provider_keys("openai")
+        if not keys:
+            raise RuntimeError("No OpenAI API key configured")
+        self.client = OpenAI(api_key=keys[0])
+
+    def submit(self, stage: str, requests: list[dict]) -> str:
+        model = configured_model("openai", stage_tier(stage))
+        schema = {**Default_Return_Schema.model_json_schema(), "additionalProperties": False}
+        lines = [json.dumps({
+            "custom_id": request["custom_id"],
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": model,
+                "messages": [{"role": "user", "content": request["prompt"].to_string()}],
+                "max_completion_tokens": MAX_COMPLETION_TOKENS,
+                "response_format": {
+                    "type": "json_schema",
+                    "json_schema": {"name": "analysis", "strict": True, "schema": schema}
+                }
+            }
+        }) for request in requests]
+        upload = self.client.files.create(file=("reanalysis.jsonl", "\n".join(lines).encode()), purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=upload.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        return batch.id
+
+    def poll(self, batch_id: str) -> str:
+        status = self.client.batches.retrieve(batch_id).status
+        # Expired batches still return whatever finished in time
+        if status in ("completed", "expired"):
+            return "completed"
+        if status in ("failed", "cancelled"):
+            return "failed"
+        return "in_progress"
+
+    def results(self, stage: str, batch_id: str) -> dict[str, dict]:
+        batch = self.client.batches.retrieve(batch_id)
+        # Stamp with the configured name; responses report a dated snapshot
+        model = configured_model("openai", stage_tier(stage))
+        results = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                record = json.loads(line)
+                results[record["custom_id"]] = _parse_batch_record(record, model)
+        return results
+
+
+def _parse_batch_record(record: dict, model: str) -> dict:
+    response = record.get("response") or {}
+    if response.get("status_code") != 200:
+        return {"error": json.dumps(record.get("error") or response.get("body"))}
+    body = response["body"]
+    try:
+        parsed = Default_Return_Schema.model_validate_json(body["choices"][0]["message"]["content"])
+    except Exception as e:
+        return {"error": f"Unparseable output: {e}"}
+    return {"message": parsed.message, "extended_message": parsed.extended_message, "model": model}
+
+
+BACKENDS = {"local": LocalBatchBackend, "openai": OpenAIBatchBackend}
+
+
+def current_models(stage: str) -> set[str]:
+    return get_pool().stage_models(stage)
+
+
+def build_requests(db: MongoDBManager, stage: str, documents: list[dict]) -> list[dict]:
+    """Prompts for outdated analyses, built the same way the pipelines build them"""
+    requests = []
+    for document in documents:
+        if stage == "policy_analysis":
+            terms, privacy = document.get("terms_markdown") or "", document.get("privacy_markdown") or ""
+            prompt = build_policy_prompt(terms, privacy, scan_policies(terms, privacy), document["url"])
+            requests.append({"custom_id": document["url"], "prompt": prompt})
+        else:
+            domain = document["domain"]
+            reviews = db.get_review_records(domain, limit=REANALYSIS_REVIEW_LIMIT)
+            stats = compute_review_stats(db.get_reviews(domain))
+            requests.append({"custom_id": domain, "prompt": build_reviews_prompt(domain, "", stats, reviews)})
+    return requests
+
+
+def apply_results(db: MongoDBManager, stage: str, results: dict[str, dict]) -> list[str]:
+    """Store successful results; returns the custom_ids that failed"""
+    failed = []
+    for key, result in results.items():
+        if "error" in result:
+            print(f"Reanalysis of {key} failed: {result['error']}")
+            failed.append(key)
+            continue
+        stamp = analysis_version(stage, result["model"])
+        if stage == "policy_analysis":
+            db.save_policy_reanalysis(key, result["message"], result["extended_message"], stamp)
+        else:
+            db.save_reviews_reanalysis(key, result["message"], result["extended_message"], stamp)
+    return failed
+
+
+def new_job(db: MongoDBManager, stage: str, backend: str, batch_size: int,
+            max_in_flight: int, max_requests: Optional[int], max_attempts: int = MAX_ATTEMPTS) -> dict:
+    models = current_models(stage)
+    now = datetime.utcnow()
+    return {
+        "_id": f"reanalysis-{now.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}",
+        "stage": stage,
+        "backend": backend,
+        "prompt_version": PROMPT_VERSIONS[stage],
+        "models": sorted(models),
+        "batch_size": batch_size,
+        "max_in_flight": max_in_flight,
+        "max_requests": max_requests,
+        "max_attempts": max_attempts,
+        "status": "running",
+        "outdated_at_start": db.count_analyses(stage, PROMPT_VERSIONS[stage], models)["outdated"],
+        "submitted": 0,
+        "succeeded": 0,
+        "failed": 0,
+        "abandoned_keys": [],
+        "batches": [],
+        "created_at": now,
+        "updated_at": now
+    }
+
+
+def run_job(db: MongoDBManager, job: dict, backend: BatchBackend, poll_seconds: float = 30):
+    """Submit outdated analyses batch by batch and apply results until none are left"""
+    stage = job["stage"]
+    if job["prompt_version"] != PROMPT_VERSIONS[stage]:
+        raise RuntimeError(f"Prompt changed since job {job['_id']} started; start a new job")
+    models = set(job["models"])
+    max_attempts = job.get("max_attempts", MAX_ATTEMPTS)
+
+    def save():
+        job["updated_at"] = datetime.utcnow()
+        db.save_reanalysis_job(job)
+
+    while True:
+        for batch in job["batches"]:
+            if batch["status"] != "submitted":
+                continue
+            state = backend.poll(batch["batch_id"])
+            if state == "in_progress":
+                continue
+            if state == "completed":
+                results = backend.results(stage, batch["batch_id"])
+                failed = apply_results(db, stage, results)
+                batch["failed_keys"] = failed
+                job["succeeded"] += len(results) - len(failed)
+                job["failed"] += len(failed)
+                print(f"Batch {batch['batch_id']}: {len(results) - len(failed)} updated, {len(failed)} failed")
+            else:
+                # Keys of failed or lost batches are still outdated and get
+                # resubmitted, up to max_attempts batches each
+                attempts = Counter(key for b in job["batches"] for key in b["keys"])
+                abandoned = [key for key in batch["keys"] if attempts[key] >= max_attempts]
+                job.setdefault("abandoned_keys", []).extend(abandoned)
+                job["failed"] += len(abandoned)
+                print(f"Batch {batch['batch_id']} {state}, giving up on {len(abandoned)} of its keys")
+            batch["status"] = state
+            batch["finished_at"] = datetime.utcnow()
+            save()
+
+        in_flight = [b for b in job["batches"] if b["status"] == "submitted"]
+        # Failed results are not retried within a job; a new job picks them up
+        exclude = [key for b in job["batches"] if b["status"] in ("submitted", "completed")
+                   for key in (b["keys"] if b["status"] == "submitted" else b.get("failed_keys", []))]
+        exclude.extend(job.get("abandoned_keys", []))
+        while len(in_flight) < job["max_in_flight"]:
+            limit = job["batch_size"]
+            if job["max_requests"] is not None:
+                limit = min(limit, job["max_requests"] - job["submitted"])
+            if limit <= 0:
+                break
+            documents = db.find_outdated_analyses(stage, job["prompt_version"], models, exclude, limit)
+            if not documents:
+                break
+            requests = build_requests(db, stage, documents)
+            keys = [request["custom_id"] for request in requests]
+            batch = {
+                "batch_id": backend.submit(stage, requests),
+                "backend": backend.name,
+                "keys": keys,
+                "status": "submitted",
+                "submitted_at": datetime.utcnow()
+            }
+            job["batches"].append(batch)
+            job["submitted"] += len(keys)
+            in_flight.append(batch)
+            exclude.extend(keys)
+            print(f"Submitted batch {batch['batch_id']} with {len(keys)} requests")
+            save()
+
+        if not in_flight:
+            job["status"] = "completed"
+            save()
+            print(f"Job {job['_id']} completed")
+            return job
+        if all(backend.poll(b["batch_id"]) == "in_progress" for b in in_flight):
+            time.sleep(poll_seconds)
+
+
+def print_status(db: MongoDBManager):
+    for stage in STAGES:
+        counts = db.count_analyses(stage, PROMPT_VERSIONS[stage], current_models(stage))
+        print(f"{stage:<18} prompt {PROMPT_VERSIONS[stage]}  models {sorted(current_models(stage))}  "
+              f"{counts['outdated']}/{counts['total']} outdated")
+
+
+def print_report(job: dict):
+    print(f"Job {job['_id']} ({job['stage']} via {job['backend']}): {job['status']}")
+    print(f"  prompt {job['prompt_version']}, models {job['models']}")
+    print(f"  outdated at start {job['outdated_at_start']}, submitted {job['submitted']}, "
+          f"succeeded {job['succeeded']}, failed {job['failed']}")
+    abandoned = job.get("abandoned_keys", [])
+    if abandoned:
+        print(f"  gave up after {job.get('max_attempts', MAX_ATTEMPTS)} failed or lost batches: "
+              f"{', '.join(abandoned[:20])}{' ...' if len(abandoned) > 20 else ''}")
+    for batch in job.get("batches", []):
+        print(f"  {batch['batch_id']:<40} {batch['status']:<12} {len(batch['keys']):>6} requests "
+              f"{len(batch.get('failed_keys', [])):>5} failed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-run outdated LLM analyses over cached inputs")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="Outdated analyses per stage")
+    run_parser = commands.add_parser("run", help="Start a re-analysis job")
+    run_parser.add_argument("--stage", choices=STAGES, required=True)
+    run_parser.add_argument("--backend", choices=sorted(BACKENDS), default="local")
+    run_parser.add_argument("--batch-size", type=int, default=500)
+    run_parser.add_argument("--max-in-flight", type=int, default=2, help="Batches submitted at once")
+    run_parser.add_argument("--max-requests", type=int, default=None, help="Stop after this many requests")
+    run_parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS,
+                            help="Failed or lost batches a key may be in before it is given up")
+    run_parser.add_argument("--concurrency", type=int, default=4, help="Parallel calls for the local backend")
+    run_parser.add_argument("--poll-seconds", type=float, default=30)
+    resume_parser = commands.add_parser("resume", help="Continue an interrupted job")
+    resume_parser.add_argument("job_id")
+    resume_parser.add_argument("--concurrency", type=int, default=4)
+    resume_parser.add_argument("--poll-seconds", type=float, default=30)
+    report_parser = commands.add_parser("report", help="Show one job, or list recent jobs")
+    report_parser.add_argument("job_id", nargs="?")
+    args = parser.parse_args()
+
+    with MongoDBManager() as db:
+        if args.command == "status":
+            print_status(db)
+        elif args.command == "report":
+            if args.job_id:
+                job = db.get_reanalysis_job(args.job_id)
+                if job:
+                    print_report(job)
+                else:
+                    print(f"No job {args.job_id}")
+            else:
+                for job in db.list_reanalysis_jobs():
+                    print_report(job)
+        else:
+            if args.command == "run":
+                job = new_job(db, args.stage, args.backend, args.batch_size, args.max_in_flight,
+                              args.max_requests, args.max_attempts)
+                db.save_reanalysis_job(job)
+                print(f"Started job {job['_id']}: {job['outdated_at_start']} outdated analyses")
+            else:
+                job = db.get_reanalysis_job(args.job_id)
+                if not job:
+                    raise SystemExit(f"No job {args.job_id}")
+            backend_class = BACKENDS[job["backend"]]
+            backend = backend_class(args.concurrency) if backend_class is LocalBatchBackend else backend_class()
+            print_report(run_job(db, job, backend, args.poll_seconds))
@@ -0,0 +1,256 @@
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+
+class UpstreamError(Exception):
+    """Base for failures raised by the resilience layer itself"""
+
+
+class UpstreamTimeout(UpstreamError):
+    pass
+
+
+class CircuitOpenError(UpstreamError):
+    pass
+
+
+class BudgetExhausted(UpstreamError):
+    pass
+
+
+class Budget:
+    """Wall-clock budget for one request; stages get whatever is left"""
+
+    def __init__(self, seconds: float):
+        self.deadline = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def stage_timeout(self, cap: float) -> float:
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise BudgetExhausted("Request budget exhausted")
+        return min(cap, remaining)
+
+
+_current_budget: ContextVar[Optional[Budget]] = ContextVar("current_budget", default=None)
+
+@contextmanager
+def request_budget(seconds: float):
+    """Give every upstream call made inside the block a shared deadline"""
+    token = _current_budget.set(Budget(seconds))
+    try:
+        yield
+    finally:
+        _current_budget.reset(token)
+
+def current_budget() -> Optional[Budget]:
+    return _current_budget.get()
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and fails fast for
+    reset_timeout seconds, then lets one trial call through (half-open).
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_neutral(self):
+        """A call that says nothing about upstream health, e.g. a 4xx or bad output"""
+        with self._lock:
+            # Neither closes the circuit nor resets the failure count; a
+            # half-open breaker lets its next trial call through
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    print(f"Circuit breaker {self.name} opened")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+_metrics = defaultdict(Counter)
+_metrics_lock = threading.Lock()
+# Upstream calls run here so callers can stop waiting on a hung request. The
+# clients' own socket timeouts are what make a hung call give its thread back.
+_upstream_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="upstream")
+
+
+def get_breaker(upstream: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if upstream not in _breakers:
+            _breakers[upstream] = CircuitBreaker(
+                upstream,
+                failure_threshold=int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5")),
+                reset_timeout=float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+            )
+        return _breakers[upstream]
+
+
+def _count(upstream: str, event: str):
+    with _metrics_lock:
+        _metrics[upstream][event] += 1
+
+
+def status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Timeouts, rate limits, server errors and transport failures"""
+    if isinstance(error, UpstreamTimeout):
+        return True
+    if isinstance(error, UpstreamError):
+        return False
+    status = status_code(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(error, (ConnectionError, TimeoutError)) or type(error).__name__ in (
+        "APIConnectionError", "APITimeoutError", "Timeout", "ConnectTimeout", "ReadTimeout", "ConnectError"
+    )
+
+
+def _submit(fn: Callable):
+    # Each attempt runs in a copy of the caller's context, so usage
+    # accounting sees the pipeline's recorder from the worker thread
+    return _upstream_executor.submit(contextvars.copy_context().run, fn)
+
+
+def _run_with_timeout(upstream: str, fn: Callable, timeout: float, hedge_after: Optional[float]):
+    """Run fn off-thread, optionally firing a duplicate if it's slow"""
+    started = time.monotonic()
+    futures = [_submit(fn)]
+    if hedge_after is not None and hedge_after < timeout:
+        done, _ = wait(futures, timeout=hedge_after)
+        if not done:
+            _count(upstream, "hedges")
+            futures.append(_submit(fn))
+
+    pending = set(futures)
+    last_error = None
+    while pending:
+        remaining = timeout - (time.monotonic() - started)
+        if remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if len(futures) > 1 and future is futures[1]:
+                    _count(upstream, "hedge_wins")
+                return future.result()
+            last_error = future.exception()
+    if last_error is not None and not pending:
+        raise last_error
+    for future in futures:
+        future.cancel()
+    raise UpstreamTimeout(f"{upstream} call timed out after {timeout:.1f}s")
+
+
+def call_upstream(upstream: str, fn: Callable, *, timeout: float, retries: int = 2,
+                  hedge_after: Optional[float] = None, base_delay: float = 0.5, max_delay: float = 8.0):
+    """
+    Call an upstream with a deadline, jittered retries for retryable errors
+    and a per-upstream circuit breaker.
+
+    The deadline is min(timeout, what's left of the current request budget).
+    hedge_after (seconds) sends a duplicate request if the first is slow;
+    only use it for idempotent calls. fn runs once per attempt and per
+    hedge, in the caller's context, so it can account for each of them.
+    """
+    breaker = get_breaker(upstream)
+    budget = current_budget()
+    for attempt in range(retries + 1):
+        # Before allow(): a spent budget must not claim the half-open trial
+        stage_timeout = budget.stage_timeout(timeout) if budget else timeout
+        if not breaker.allow():
+            _count(upstream, "short_circuited")
+            raise CircuitOpenError(f"Circuit open for {upstream}")
+
+        _count(upstream, "calls")
+        try:
+            result = _run_with_timeout(upstream, fn, stage_timeout, hedge_after)
+        except Exception as e:
+            retryable = is_retryable_error(e)
+            _count(upstream, "timeouts" if isinstance(e, UpstreamTimeout) else "failures")
+            if retryable:
+                breaker.record_failure()
+            else:
+                # Client errors (4xx) say nothing about upstream health
+                breaker.record_neutral()
+            if not retryable or attempt == retries:
+                raise
+            # Full jitter backoff, never sleeping past the budget
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            if budget and delay >= budget.remaining():
+                raise
+            _count(upstream, "retries")
+            print(f"Retrying {upstream} in {delay:.2f}s after: {e}")
+            time.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
+
+
+def resilience_stats() -> list[dict]:
+    """Per-upstream call, retry, timeout and hedge counters with breaker state"""
+    with _metrics_lock:
+        metrics = {name: dict(counter) for name, counter in _metrics.items()}
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    stats = []
+    for name in sorted(set(metrics) | set(breakers)):
+        breaker = breakers.get(name)
+        stats.append({
+            "upstream": name,
+            "breaker_state": breaker.state if breaker else "closed",
+            "consecutive_failures": breaker.failures if breaker else 0,
+            **{event: metrics.get(name, {}).get(event, 0) for event in
+               ("calls", "retries", "failures", "timeouts", "short_circuited", "hedges", "hedge_wins")}
+        })
+    return stats
@@ -0,0 +1,161 @@
+import re
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+TRUSTPILOT_404_IMAGE = "https://images-static.trustpilot.com/community/errors/404_beige.png"
+
+# Each review card links to its own page: trustpilot.com/reviews/<24 hex id>
+_REVIEW_LINK_RE = re.compile(r"trustpilot\.com/reviews/([0-9a-f]{24})")
+# ...and opens with the reviewer's profile link (avatar, name, country, review count),
+# before its rating, date and title permalink
+_PROFILE_LINK_RE = re.compile(r"\[(?:[^\[\]]|\[[^\[\]]*\])*\]\([^)\s]*trustpilot\.com/users/[0-9a-f]+[^)]*\)")
+_RATING_RE = re.compile(r"Rated (\d) out of 5")
+_EXPERIENCE_DATE_RE = re.compile(r"Date of experience:?\s*\**\s*([A-Z][a-z]+ \d{1,2}, \d{4})")
+_DATE_RE = re.compile(r"\b([A-Z][a-z]{2,8} \d{1,2}, \d{4})\b")
+_RELATIVE_DATE_RE = re.compile(r"\b(\d+|an?) (minute|hour|day)s? ago\b")
+_IMAGE_RE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+_LINK_RE = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+_LABEL_RE = re.compile(r"(Date of experience:?|Rated \d out of 5 stars?|Verified|Unprompted review|Invited|Useful|Share|Report)")
+
+
+def _parse_date(segment: str, now: datetime) -> Optional[datetime]:
+    match = _EXPERIENCE_DATE_RE.search(segment) or _DATE_RE.search(segment)
+    if match:
+        for fmt in ("%B %d, %Y", "%b %d, %Y"):
+            try:
+                return datetime.strptime(match.group(1), fmt)
+            except ValueError:
+                continue
+    relative = _RELATIVE_DATE_RE.search(segment)
+    if relative:
+        amount = 1 if relative.group(1) in ("a", "an") else int(relative.group(1))
+        return now - timedelta(**{f"{relative.group(2)}s": amount})
+    return None
+
+
+def _clean_text(segment: str) -> str:
+    text = _IMAGE_RE.sub(" ", segment)
+    text = _LINK_RE.sub(r"\1", text)
+    text = _LABEL_RE.sub(" ", text)
+    text = _DATE_RE.sub(" ", text)
+    text = _RELATIVE_DATE_RE.sub(" ", text)
+    text = re.sub(r"[#*_>|]+", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _card_starts(markdown: str) -> list[int]:
+    """Offsets where review cards begin: each reviewer profile link, else each permalink line"""
+    starts = [match.start() for match in _PROFILE_LINK_RE.finditer(markdown)]
+    if starts:
+        return starts
+    starts = []
+    seen = set()
+    for match in _REVIEW_LINK_RE.finditer(markdown):
+        if match.group(1) not in seen:
+            seen.add(match.group(1))
+            starts.append(markdown.rfind("\n", 0, match.start()) + 1)
+    return starts
+
+
+def parse_reviews(markdown: str) -> list[dict]:
+    """
+    Split a Trustpilot review page's markdown into review records:
+    {"review_id", "date", "rating", "text"}. The page is cut where each card
+    starts (the reviewer's profile link), so a card's rating and date, which
+    come before its title permalink, stay with it.
+    """
+    now = datetime.utcnow()
+    starts = _card_starts(markdown)
+    records = []
+    seen = set()
+    for start, end in zip(starts, starts[1:] + [len(markdown)]):
+        segment = markdown[start:end]
+        match = _REVIEW_LINK_RE.search(segment)
+        if not match or match.group(1) in seen:
+            continue
+        seen.add(match.group(1))
+        rating = _RATING_RE.search(segment)
+        records.append({
+            "review_id": match.group(1),
+            "date": _parse_date(segment, now),
+            "rating": int(rating.group(1)) if rating else None,
+            # The profile link only holds the reviewer's name and country
+            "text": _clean_text(_PROFILE_LINK_RE.sub(" ", segment))[:2000]
+        })
+    return records
+
+
+def review_page_url(domain: str, page: int) -> str:
+    return f"https://trustpilot.com/review/{domain}?sort=recency&page={page}"
+
+
+def fetch_new_reviews(domain: str, known_ids: set[str], scrape: Callable[[str], dict],
+                      max_pages: int) -> Optional[list[dict]]:
+    """
+    Fetch review pages newest first until a known review shows up.
+
+    Returns only reviews not in known_ids, or None if Trustpilot has no
+    page for the domain.
+    """
+    new_reviews = []
+    for page in range(1, max_pages + 1):
+        markdown = scrape(review_page_url(domain, page)).get('markdown', '')
+        if TRUSTPILOT_404_IMAGE in markdown:
+            return None if page == 1 else new_reviews
+        records = parse_reviews(markdown)
+        if not records:
+            break
+        fresh = [r for r in records if r["review_id"] not in known_ids]
+        new_reviews.extend(fresh)
+        if len(fresh) < len(records):
+            # Reached reviews ingested last time
+            break
+    print(f"Fetched {len(new_reviews)} new reviews for {domain}")
+    return new_reviews
+
+
+def format_reviews_for_prompt(reviews: list[dict]) -> str:
+    lines = []
+    for review in reviews:
+        rating = f"{review['rating']}/5" if review.get("rating") else "unrated"
+        date = review["date"].strftime("%Y-%m-%d") if review.get("date") else "undated"
+        lines.append(f"- [{rating}, {date}] {review['text']}")
+    return "\n".join(lines)
+
+
+def compute_review_stats(reviews: list[dict], now: Optional[datetime] = None) -> dict:
+    """
+    Rating histogram, averages and monthly trend from stored reviews.
+    Pure local computation, no model call.
+    """
+    now = now or datetime.utcnow()
+    rated = [r for r in reviews if r.get("rating")]
+    histogram = Counter(r["rating"] for r in rated)
+    average = lambda items: round(sum(r["rating"] for r in items) / len(items), 2) if items else None
+
+    recent_cutoff = now - timedelta(days=30)
+    recent = [r for r in rated if r.get("date") and r["date"] >= recent_cutoff]
+    previous = [r for r in rated if r.get("date") and recent_cutoff - timedelta(days=60) <= r["date"] < recent_cutoff]
+
+    by_month = defaultdict(list)
+    for review in rated:
+        if review.get("date"):
+            by_month[review["date"].strftime("%Y-%m")].append(review)
+    monthly = [
+        {"month": month, "count": len(items), "average": average(items)}
+        for month, items in sorted(by_month.items())[-12:]
+    ]
+
+    recent_average = average(recent)
+    previous_average = average(previous)
+    return {
+        "total_reviews": len(reviews),
+        "rated_reviews": len(rated),
+        "histogram": {str(stars): histogram.get(stars, 0) for stars in range(1, 6)},
+        "average": average(rated),
+        "last_30_days_average": recent_average,
+        "previous_60_days_average": previous_average,
+        "trend": round(recent_average - previous_average, 2) if recent_average is not None and previous_average is not None else None,
+        "monthly": monthly
+    }
@@ -1,30 +1,79 @@
 from typing import Dict, Union, Optional
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, HTTPException, Request, status
 from urllib.parse import urlsplit, urlparse
 import asyncio
-from starlette.responses import Content
-from database import MongoDBManager
+from contextlib import asynccontextmanager
+from database import get_shared_manager, close_shared_manager
+from async_database import AsyncMongoDBManager
 from pydantic import BaseModel
 from web_scraper import scraper_pipeline, scrape_reviews_pipeline
+from llm_pool import get_pool
+from admission import AdmissionRejected, get_admission_controller
+from reviews import compute_review_stats
+from resilience import resilience_stats
+from usage import UsageBudgetExceeded, seconds_until_reset, usage_day
+from snapshot import get_snapshot, rebuild_periodically, snapshot_config
+from profiler import list_profiles, profile_path, profile_request, profiler_config
+from fastapi.responses import FileResponse
 from typing import List
 from datetime import datetime
 
-app = FastAPI()
+_async_db: Optional[AsyncMongoDBManager] = None
+_async_db_lock = asyncio.Lock()
+
+async def get_async_db() -> AsyncMongoDBManager:
+    """Shared async repository for the routes, connected on first use"""
+    global _async_db
+    if _async_db is None:
+        async with _async_db_lock:
+            if _async_db is None:
+                _async_db = await AsyncMongoDBManager.connect()
+    return _async_db
+
+async def get_pipeline_db():
+    """Shared sync manager for pipelines running in worker threads"""
+    return await asyncio.get_running_loop().run_in_executor(None, get_shared_manager)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    snapshot_task = None
+    if snapshot_config()["rebuild_seconds"] > 0:
+        snapshot_task = asyncio.create_task(rebuild_periodically(get_shared_manager))
+    yield
+    if snapshot_task is not None:
+        snapshot_task.cancel()
+    if _async_db is not None:
+        await _async_db.close()
+    close_shared_manager()
+
+app = FastAPI(lifespan=lifespan)
+# Opt-in sampling profiler (PROFILER_ENABLED + X-Profile header or sample rate)
+app.middleware("http")(profile_request)
 
 class WebsiteRequest(BaseModel):
     website: str
 
 class WebsiteMessageResponse(BaseModel):
     message: str
-    extended_message: str
+    extended_message: Optional[str] = None
     reviews_message: Optional[str] = None
     reviews_extended_message: Optional[str] = None
+    provisional: bool = False
 
 class WebsiteResponse(WebsiteMessageResponse):
     id: str
     url: str
     created_at: datetime
 
+class WebsiteChange(WebsiteResponse):
+    version: int
+    updated_at: datetime
+
+class WebsiteChangesResponse(BaseModel):
+    changes: List[WebsiteChange]
+    next_token: str
+    has_more: bool
+
 def validate_root_url(url: str) -> str:
     """Normalize URL to ensure HTTPS scheme and proper formatting"""
     if not url:
@@ -44,16 +93,46 @@ def validate_root_url(url: str) -> str:
 
     return url
 
+def client_id(request: Request) -> str:
+    """Identify the caller for fair queueing: extension install id, else IP"""
+    return request.headers.get("X-Client-Id") or (request.client.host if request.client else "unknown")
+
+@asynccontextmanager
+async def admit(pipeline: str, request: Request):
+    """Hold a pipeline slot for this request or answer 429 with Retry-After"""
+    try:
+        async with get_admission_controller().slot(pipeline, client_id(request)):
+            yield
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+def usage_budget_response(error: UsageBudgetExceeded) -> HTTPException:
+    """429 until the daily usage budgets reset"""
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=str(error),
+        headers={"Retry-After": str(seconds_until_reset())}
+    )
+
 @app.get("/check_root_url/{root_url}", response_model=Dict[str, bool])
-def check_root_url(root_url: str):
+async def check_root_url(root_url: str):
     """
     Check if a root URL exists in the database
     Returns {'exists': true/false}
     """
     try:
         normalized_url = validate_root_url(root_url)
-        with MongoDBManager() as db:
-            exists = db.website_exists(normalized_url)
+        # Finished sites are never deleted, so a snapshot hit can't be stale;
+        # only misses (new or still-running sites) go to MongoDB
+        snapshot = get_snapshot()
+        if snapshot is not None and snapshot.contains(normalized_url):
+            return {"exists": True}
+        db = await get_async_db()
+        exists = await db.website_exists(normalized_url)
         return {"exists": exists}
     except HTTPException:
         raise
@@ -63,33 +142,93 @@ def check_root_url(root_url: str):
             detail=f"Database error: {str(e)}"
         )
 
+# Pipelines that outlive the request that started them
+background_pipelines = set()
+
+def _forget_pipeline(task: asyncio.Task):
+    background_pipelines.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Background pipeline failed: {task.exception()}")
+
+async def analyze_with_provisional(url: str, request: Request) -> tuple[str, str, bool]:
+    """
+    Run the policy pipeline, returning the local scanner's provisional result
+    as soon as it is stored. The pipeline keeps its admission slot and carries
+    on in the background until the model's analysis replaces it.
+    Returns (message, extended_message, provisional).
+    """
+    loop = asyncio.get_running_loop()
+    provisional = loop.create_future()
+
+    def publish(message: str, extended_message: str):
+        loop.call_soon_threadsafe(
+            lambda: provisional.done() or provisional.set_result((message, extended_message))
+        )
+
+    async def run_admitted():
+        async with admit("policy", request):
+            db = await get_pipeline_db()
+            return await loop.run_in_executor(
+                None,
+                lambda: scraper_pipeline(url, db, on_provisional=publish, endpoint="get_warning")
+            )
+
+    task = asyncio.ensure_future(run_admitted())
+    background_pipelines.add(task)
+    task.add_done_callback(_forget_pipeline)
+
+    await asyncio.wait({task, provisional}, return_when=asyncio.FIRST_COMPLETED)
+    if task.done():
+        message, extended_message = task.result()
+        return message, extended_message, False
+    message, extended_message = provisional.result()
+    return message, extended_message, True
+
 @app.get("/get_warning/{root_url}", response_model=WebsiteMessageResponse)
-def get_warning(root_url: str):
+async def get_warning(root_url: str, request: Request, details: bool = True):
     """
-    Retrieve warnings - check DB first, then scrape live if missing
+    Retrieve warnings - check DB first, then scrape live if missing.
+    details=false skips loading the extended messages.
     """
     try:
         normalized_url = validate_root_url(root_url)
-        with MongoDBManager() as db:
-            website = db.get_website(normalized_url)
-
-            if not website:
-                message, extended_message = scraper_pipeline(normalized_url)
-                return {
-                    "message": message,
-                    "extended_message": extended_message,
-                    "reviews_message": None,
-                    "reviews_extended_message": None
-                }
+        snapshot = get_snapshot()
+        summary = snapshot.get(normalized_url) if snapshot is not None else None
+        if summary and not details:
+            # Short fields of known sites come from the shared snapshot without a DB round trip
+            return {**summary, "extended_message": None, "reviews_extended_message": None}
+
+        try:
+            db = await get_async_db()
+            website = await db.get_website(normalized_url, include_details=details)
+        except Exception as e:
+            if not summary:
+                raise
+            # Keep serving known sites while MongoDB is unreachable
+            print(f"Serving snapshot summary for {normalized_url}: {e}")
+            return {**summary, "extended_message": None, "reviews_extended_message": None}
 
+        if not website:
+            message, extended_message, provisional = await analyze_with_provisional(normalized_url, request)
             return {
-                "message": website.get("message"),
-                "extended_message": website.get("extended_message"),
-                "reviews_message": website.get("reviews_message"),
-                "reviews_extended_message": website.get("reviews_extended_message")
+                "message": message,
+                "extended_message": extended_message,
+                "reviews_message": None,
+                "reviews_extended_message": None,
+                "provisional": provisional
             }
+
+        return {
+            "message": website.get("message"),
+            "extended_message": website.get("extended_message"),
+            "reviews_message": website.get("reviews_message"),
+            "reviews_extended_message": website.get("reviews_extended_message"),
+            "provisional": website.get("provisional", False)
+        }
     except HTTPException:
         raise
+    except UsageBudgetExceeded as e:
+        raise usage_budget_response(e)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -99,63 +238,76 @@ def get_warning(root_url: str):
 @app.post("/add_website",
           status_code=status.HTTP_201_CREATED,
           response_model=WebsiteResponse)
-async def add_website(request: WebsiteRequest):
+async def add_website(request: WebsiteRequest, http_request: Request):
     """
     Add website with auto-generated messages
     """
     try:
         normalized_url = validate_root_url(request.website)
 
-        with MongoDBManager() as db:
-            if db.website_exists(normalized_url):
-                raise HTTPException(
-                    status_code=status.HTTP_409_CONFLICT,
-                    detail="Website already exists in database"
-                )
+        db = await get_async_db()
+        if await db.website_exists(normalized_url):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Website already exists in database"
+            )
 
-            try:
-                # Robust domain extraction
-                extract_domain = lambda url: urlparse(url.strip()).netloc or urlparse(f"https://{url.strip()}").netloc
-                loop = asyncio.get_running_loop()
+        # Robust domain extraction
+        extract_domain = lambda url: urlparse(url.strip()).netloc or urlparse(f"https://{url.strip()}").netloc
+        loop = asyncio.get_running_loop()
 
-                scraper_future = loop.run_in_executor(
-                    None,
-                    lambda: scraper_pipeline(normalized_url)
-                )
+        async def run_admitted(pipeline: str, run):
+            # Each run holds only its own slot, never one while queueing for the other
+            async with admit(pipeline, http_request):
+                pipeline_db = await get_pipeline_db()
+                return await loop.run_in_executor(None, lambda: run(pipeline_db))
 
-                reviews_future = loop.run_in_executor(
-                    None,
-                    lambda: scrape_reviews_pipeline(extract_domain(normalized_url))
-                )
-
-                (message, extended_message), (reviews_message, reviews_extended_message) = await asyncio.gather(
-                    scraper_future,
-                    reviews_future
+        try:
+            (message, extended_message), (reviews_message, reviews_extended_message) = await asyncio.gather(
+                run_admitted(
+                    "policy",
+                    lambda pipeline_db: scraper_pipeline(normalized_url, pipeline_db, endpoint="add_website")
+                ),
+                run_admitted(
+                    "reviews",
+                    lambda pipeline_db: scrape_reviews_pipeline(
+                        extract_domain(normalized_url), pipeline_db, endpoint="add_website"
+                    )
                 )
+            )
 
-            except Exception as e:
-                raise HTTPException(
-                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-                    detail=f"Scraping failed: {str(e)}"
-                )
+        except HTTPException:
+            raise
+        except UsageBudgetExceeded as e:
+            raise usage_budget_response(e)
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Scraping failed: {str(e)}"
+            )
 
-            website_id = db.add_website(
-                url=normalized_url,
-                message=message,
-                extended_message=extended_message,
-                reviews_message=reviews_message,
-                reviews_extended_message=reviews_extended_message
+        website_id = await db.add_website(
+            url=normalized_url,
+            message=message,
+            extended_message=extended_message,
+            reviews_message=reviews_message,
+            reviews_extended_message=reviews_extended_message
+        )
+        if website_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Website already exists in database"
             )
 
-            return {
-                "id": website_id,
-                "url": normalized_url,
-                "message": message,
-                "extended_message": extended_message,
-                "reviews_message": reviews_message,
-                "reviews_extended_message": reviews_extended_message,
-                "created_at": datetime.utcnow()
-            }
+        return {
+            "id": website_id,
+            "url": normalized_url,
+            "message": message,
+            "extended_message": extended_message,
+            "reviews_message": reviews_message,
+            "reviews_extended_message": reviews_extended_message,
+            "created_at": datetime.utcnow()
+        }
 
     except HTTPException:
         raise
@@ -168,15 +320,54 @@ async def add_website(request: WebsiteRequest):
 @app.get("/get_websites",
          response_model=List[WebsiteResponse],
          response_description="List of all monitored websites")
-def get_all_websites():
+async def get_all_websites(details: bool = True):
     """
     Retrieve all websites from the database
     """
     try:
-        with MongoDBManager() as db:
-            websites = db.get_all_websites()
+        db = await get_async_db()
+        websites = await db.get_all_websites(include_details=details)
+
+        return [
+            {
+                "id": site["_id"],
+                "url": site["url"],
+                "message": site["message"],
+                "extended_message": site.get("extended_message"),
+                "reviews_message": site["reviews_message"],
+                "reviews_extended_message": site.get("reviews_extended_message"),
+                "created_at": site["created_at"]
+            } for site in websites
+        ]
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve websites: {str(e)}"
+        )
+
+@app.get("/websites/changes", response_model=WebsiteChangesResponse)
+async def get_website_changes(since: str = "0", limit: int = 100):
+    """
+    Websites inserted or updated after a resume token, in version order.
+    Pass the returned next_token as `since` to continue; has_more means
+    another page is ready now.
+    """
+    try:
+        since_version = int(since)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid resume token"
+        )
+    limit = max(1, min(limit, 1000))
+
+    try:
+        db = await get_async_db()
+        websites = await db.get_changes(since_version, limit)
 
-            return [
+        return {
+            "changes": [
                 {
                     "id": site["_id"],
                     "url": site["url"],
@@ -184,32 +375,149 @@ def get_all_websites():
                     "extended_message": site["extended_message"],
                     "reviews_message": site["reviews_message"],
                     "reviews_extended_message": site["reviews_extended_message"],
-                    "created_at": site["created_at"]
+                    "provisional": site["provisional"],
+                    "created_at": site["created_at"],
+                    "updated_at": site["updated_at"],
+                    "version": site["version"]
                 } for site in websites
-            ]
-
+            ],
+            "next_token": str(websites[-1]["version"] if websites else since_version),
+            "has_more": len(websites) == limit
+        }
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to retrieve websites: {str(e)}"
+            detail=f"Failed to retrieve changes: {str(e)}"
         )
 
+def run_reviews_pipeline(domain: str):
+    """Incremental review ingestion on the shared sync manager (runs in executor)"""
+    return scrape_reviews_pipeline(domain, get_shared_manager(), endpoint="analyze-reviews")
+
 class AnalyzeReviewsModel(BaseModel):
     reviews_message: Optional[str] = None
     reviews_extended_message: Optional[str] = None
 
 @app.get("/analyze-reviews/{website}", response_model=AnalyzeReviewsModel)
-def analyze_reviews(website: str):
+async def analyze_reviews(website: str, request: Request):
     try:
         domain = urlparse(website.strip()).netloc or urlparse(f"https://{website.strip()}").netloc
-        reviews_message, reviews_extended_message = scrape_reviews_pipeline(domain)
+        async with admit("reviews", request):
+            reviews_message, reviews_extended_message = await asyncio.get_running_loop().run_in_executor(
+                None,
+                run_reviews_pipeline,
+                domain
+            )
 
         return {
             "reviews_message": reviews_message,
             "reviews_extended_message": reviews_extended_message
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Review analysis failed: {str(e)}"
         )
+
+
+@app.get("/llm/providers", response_model=List[Dict[str, Union[str, int, float, bool, None]]])
+def get_llm_providers():
+    """
+    Per-provider call counts, failures, remaining quota and latency
+    """
+    return get_pool().stats()
+
+@app.get("/similarity/stats", response_model=Dict[str, Union[int, float]])
+async def get_similarity_stats():
+    """
+    Hit rate of the near-duplicate policy index
+    """
+    try:
+        db = await get_async_db()
+        return await db.get_similarity_stats()
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve similarity stats: {str(e)}"
+        )
+
+@app.get("/review-stats/{website}")
+async def get_review_stats(website: str):
+    """
+    Rating histogram and trend for stored reviews, computed without the LLM
+    """
+    try:
+        domain = urlparse(website.strip()).netloc or urlparse(f"https://{website.strip()}").netloc
+        db = await get_async_db()
+        return compute_review_stats(await db.get_reviews(domain))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to compute review stats: {str(e)}"
+        )
+
+@app.get("/usage")
+async def get_usage(day: Optional[str] = None, domain: Optional[str] = None, limit: int = 20):
+    """
+    LLM tokens, cost estimate, Firecrawl credits and wall time for a UTC day
+    (default today): per stage and endpoint, plus the top domains by tokens,
+    or for one domain
+    """
+    day = day or usage_day()
+    try:
+        datetime.strptime(day, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="day must be YYYY-MM-DD")
+    try:
+        db = await get_async_db()
+        return await db.get_usage(day, domain, max(1, min(limit, 200)))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve usage: {str(e)}"
+        )
+
+@app.get("/snapshot/stats")
+def get_snapshot_stats():
+    """
+    Entries, build time and change-feed version of this worker's snapshot
+    """
+    snapshot = get_snapshot()
+    if snapshot is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No snapshot loaded")
+    return snapshot.stats()
+
+@app.get("/admission/stats", response_model=List[Dict[str, Union[str, int]]])
+def get_admission_stats():
+    """
+    In-flight runs, queue depth and rejection counters per pipeline type
+    """
+    return get_admission_controller().stats()
+
+@app.get("/resilience/stats", response_model=List[Dict[str, Union[str, int]]])
+def get_resilience_stats():
+    """
+    Retry, timeout and hedge counters and circuit breaker state per upstream
+    """
+    return resilience_stats()
+
+@app.get("/debug/profiles")
+def get_profiles(limit: int = 50):
+    """
+    Recent request profiles (collapsed stacks), newest first
+    """
+    if not profiler_config()["enabled"]:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profiling is disabled")
+    return list_profiles(limit)
+
+@app.get("/debug/profiles/{name}")
+def get_profile(name: str):
+    """
+    Download one profile for flamegraph.pl / speedscope / inferno
+    """
+    path = profile_path(name) if profiler_config()["enabled"] else None
+    if not path:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain")
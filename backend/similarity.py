@@ -0,0 +1,87 @@
+import hashlib
+import random
+import re
+from typing import Optional
+from urllib.parse import urlsplit
+
+# MinHash over word shingles, bucketed with LSH. 16 bands of 4 rows make
+# documents above roughly 0.5 Jaccard collide in at least one bucket; the
+# final decision uses the signature estimate against SIMILARITY_THRESHOLD.
+SHINGLE_SIZE = 5
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# Policies shorter than this are error pages or stubs, not worth matching
+MIN_SHINGLES = 50
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20250119)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERM)
+]
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_LINK_RE = re.compile(r"\]\([^)]*\)")
+
+
+def shingles(text: str) -> set[int]:
+    """Hashed k-word shingles of normalised text (links and punctuation dropped)"""
+    words = _WORD_RE.findall(_LINK_RE.sub("]", text.lower()))
+    hashed = set()
+    for i in range(max(len(words) - SHINGLE_SIZE + 1, 0)):
+        shingle = " ".join(words[i:i + SHINGLE_SIZE]).encode()
+        hashed.add(int.from_bytes(hashlib.blake2b(shingle, digest_size=8).digest(), "big"))
+    return hashed
+
+
+def minhash(text: str) -> Optional[list[int]]:
+    """MinHash signature of text, or None if it's too short to compare"""
+    hashed = shingles(text)
+    if len(hashed) < MIN_SHINGLES:
+        return None
+    return [min((a * x + b) % _MERSENNE_PRIME for x in hashed) for a, b in _PERMUTATIONS]
+
+
+def lsh_bands(signature: list[int]) -> list[str]:
+    """Bucket keys, one per band; near-duplicates share at least one"""
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(",".join(map(str, rows)).encode(), digest_size=8).hexdigest()
+        keys.append(f"{band}:{digest}")
+    return keys
+
+
+def estimate_similarity(signature_a: list[int], signature_b: list[int]) -> float:
+    """Estimated Jaccard similarity of the documents behind two signatures"""
+    matches = sum(1 for a, b in zip(signature_a, signature_b) if a == b)
+    return matches / NUM_PERM
+
+
+def adapt_analysis(text: str, source_url: str, target_url: str) -> str:
+    """
+    Point a reused analysis at the new site by swapping the source's host
+    name (e.g. "www.shop-a.com" or "shop-a.com") for the target's. Bare
+    brand words are left alone: a brand like "shop" is also ordinary text.
+    """
+    source_host = (urlsplit(source_url).netloc or source_url).removeprefix("www.")
+    target_host = (urlsplit(target_url).netloc or target_url).removeprefix("www.")
+    # Not part of a longer host name, e.g. "shop-a.com" inside "myshop-a.com"
+    pattern = rf"(?<![\w.-])(?:www\.)?{re.escape(source_host)}(?![\w-])"
+    return re.sub(pattern, target_host, text, flags=re.IGNORECASE)
+
+
+def find_near_duplicate(db, signature: list[int], threshold: float, url: str) -> Optional[tuple[dict, float]]:
+    """
+    Best indexed policy document of another site at or above threshold, as
+    (document, similarity). Records the lookup as a hit or miss for the
+    index's hit rate.
+    """
+    best = None
+    for candidate in db.find_policy_candidates(lsh_bands(signature), exclude_url=url):
+        similarity = estimate_similarity(signature, candidate["signature"])
+        if similarity >= threshold and (best is None or similarity > best[1]):
+            best = (candidate, similarity)
+    db.record_similarity_lookup(hit=best is not None)
+    return best
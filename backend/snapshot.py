@@ -0,0 +1,256 @@
+# snapshot.py
+"""
+Immutable on-disk snapshot of analyzed websites: canonical URL -> message
+and reviews_message. API workers memory-map it read-only, so every worker
+shares one copy through the OS page cache. check_root_url hits and summary
+reads for known sites are served without touching MongoDB, and get_warning
+keeps working from it while MongoDB is down. Only finished sites are
+included, and those are never deleted, so a hit never goes stale; a new
+analysis shows up after the next rebuild.
+
+Layout (little-endian):
+    header   magic, format, count, built_at, max_version, website_count
+    index    count x (url hash u64, record offset u64), sorted by hash
+    records  url_len u32, message_len u32, reviews_len u32, flags u8, utf-8 bytes
+
+A new snapshot is written next to the old one and swapped in with
+os.replace, so readers see either the old file or the new one. Build it
+from cron, or let the API rebuild it every SNAPSHOT_REBUILD_SECONDS:
+
+    python snapshot.py build
+    python snapshot.py get https://example.com
+"""
+import asyncio
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, Optional
+
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+MAGIC = b"WSNAP\x00\x00\x00"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sIIQQQ")
+ENTRY = struct.Struct("<QQ")
+RECORD = struct.Struct("<IIIB")
+HAS_REVIEWS = 1
+
+
+@lru_cache(maxsize=1)
+def snapshot_config() -> dict:
+    load_dotenv()
+    return {
+        "path": os.getenv("SNAPSHOT_PATH", "snapshots/websites.snap"),
+        # How often a worker looks for a newer file
+        "check_seconds": float(os.getenv("SNAPSHOT_CHECK_SECONDS", "5")),
+        # 0 leaves rebuilding to `python snapshot.py build`
+        "rebuild_seconds": float(os.getenv("SNAPSHOT_REBUILD_SECONDS", "300")),
+    }
+
+
+def url_hash(url: str) -> int:
+    return int.from_bytes(hashlib.blake2b(url.encode(), digest_size=8).digest(), "little")
+
+
+def write_snapshot(path: str, rows: list[dict], max_version: int, website_count: int) -> int:
+    """Write rows (url, message, reviews_message) to path atomically; returns the entry count"""
+    records = []
+    for row in rows:
+        url = row["url"].encode()
+        message = (row.get("message") or "").encode()
+        reviews = row.get("reviews_message")
+        reviews_bytes = (reviews or "").encode()
+        flags = HAS_REVIEWS if reviews is not None else 0
+        records.append((url_hash(row["url"]), RECORD.pack(len(url), len(message), len(reviews_bytes), flags)
+                        + url + message + reviews_bytes))
+    records.sort(key=lambda record: record[0])
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(records), int(time.time()), max_version, website_count)
+    offset = HEADER.size + ENTRY.size * len(records)
+    index = bytearray()
+    for key, record in records:
+        index += ENTRY.pack(key, offset)
+        offset += len(record)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(index)
+        for _, record in records:
+            f.write(record)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(records)
+
+
+class SnapshotReader:
+    """Read-only view of one snapshot file; lookups decode only the matching record"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.identity = (stat.st_ino, stat.st_mtime_ns)
+        magic, file_format, self.count, self.built_at, self.max_version, self.website_count = \
+            HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or file_format != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a format {FORMAT_VERSION} snapshot")
+
+    def _key(self, index: int) -> int:
+        return ENTRY.unpack_from(self._mmap, HEADER.size + index * ENTRY.size)[0]
+
+    def _find(self, url: str) -> Optional[int]:
+        """Offset of url's record, or None"""
+        target = url_hash(url)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        encoded = url.encode()
+        # Hash collisions sit next to each other
+        while lo < self.count and self._key(lo) == target:
+            offset = ENTRY.unpack_from(self._mmap, HEADER.size + lo * ENTRY.size)[1]
+            url_len = RECORD.unpack_from(self._mmap, offset)[0]
+            start = offset + RECORD.size
+            if self._mmap[start:start + url_len] == encoded:
+                return offset
+            lo += 1
+        return None
+
+    def contains(self, url: str) -> bool:
+        return self._find(url) is not None
+
+    def get(self, url: str) -> Optional[dict]:
+        offset = self._find(url)
+        if offset is None:
+            return None
+        url_len, message_len, reviews_len, flags = RECORD.unpack_from(self._mmap, offset)
+        start = offset + RECORD.size + url_len
+        message = self._mmap[start:start + message_len].decode()
+        reviews = self._mmap[start + message_len:start + message_len + reviews_len].decode()
+        return {
+            "url": url,
+            "message": message,
+            "reviews_message": reviews if flags & HAS_REVIEWS else None
+        }
+
+    def stats(self) -> dict:
+        return {
+            "entries": self.count,
+            "built_at": datetime.utcfromtimestamp(self.built_at).isoformat(),
+            "max_version": self.max_version,
+            "size_bytes": len(self._mmap)
+        }
+
+
+_reader_lock = threading.Lock()
+_reader: Optional[SnapshotReader] = None
+_checked_at = 0.0
+
+def get_snapshot() -> Optional[SnapshotReader]:
+    """This process's reader for the newest snapshot, or None if there is none yet"""
+    global _reader, _checked_at
+    config = snapshot_config()
+    if time.monotonic() - _checked_at < config["check_seconds"]:
+        return _reader
+    with _reader_lock:
+        if time.monotonic() - _checked_at < config["check_seconds"]:
+            return _reader
+        _checked_at = time.monotonic()
+        try:
+            stat = os.stat(config["path"])
+        except FileNotFoundError:
+            return _reader
+        if _reader is None or _reader.identity != (stat.st_ino, stat.st_mtime_ns):
+            try:
+                # The old map is released once the last lookup holding it finishes
+                _reader = SnapshotReader(config["path"])
+                print(f"Loaded snapshot with {_reader.count} websites")
+            except (OSError, ValueError) as e:
+                print(f"Failed to load snapshot: {e}")
+        return _reader
+
+
+def _try_lock(lock) -> bool:
+    """Take an exclusive, non-blocking lock on an open file; False if another process holds it"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(lock.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def build_snapshot(db, force: bool = False) -> Optional[int]:
+    """
+    Rebuild the snapshot from db unless websites is unchanged since the last
+    build. Only one process builds at a time; returns the entry count, or
+    None if skipped.
+    """
+    path = snapshot_config()["path"]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.lock", "w") as lock:
+        if not _try_lock(lock):
+            return None
+        max_version, website_count = db.get_snapshot_state()
+        if not force and os.path.exists(path):
+            try:
+                current = SnapshotReader(path)
+                if (current.max_version, current.website_count) == (max_version, website_count):
+                    return None
+            except (OSError, ValueError):
+                pass
+        started = time.perf_counter()
+        count = write_snapshot(path, db.get_snapshot_rows(), max_version, website_count)
+        print(f"Built snapshot of {count} websites in {time.perf_counter() - started:.2f}s")
+        return count
+
+
+async def rebuild_periodically(get_db: Callable):
+    """Background task for the API: keep the snapshot fresh (get_db runs in a thread)"""
+    interval = snapshot_config()["rebuild_seconds"]
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, lambda: build_snapshot(get_db()))
+        except Exception as e:
+            print(f"Snapshot rebuild failed: {e}")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build or inspect the website snapshot")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("build", help="Rebuild now, even if nothing changed")
+    get_parser = commands.add_parser("get", help="Look up one canonical URL")
+    get_parser.add_argument("url")
+    commands.add_parser("stats")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from database import MongoDBManager
+        with MongoDBManager() as db:
+            build_snapshot(db, force=True)
+    else:
+        reader = SnapshotReader(snapshot_config()["path"])
+        print(reader.get(args.url) if args.command == "get" else reader.stats())
@@ -0,0 +1,114 @@
+# stubs.py
+"""
+Stand-ins for Firecrawl and the LLM providers for load tests and local runs
+without API keys. They sleep for a lognormal latency around
+STUB_FIRECRAWL_LATENCY_MS / STUB_LLM_LATENCY_MS and return deterministic
+synthetic content, so no credits or tokens are spent. Nothing in the API
+imports this module; start it through the factory instead:
+
+    uvicorn --factory stubs:stubbed_app
+"""
+import os
+import random
+import time
+from typing import get_origin
+
+# Words synthetic policies are built from; seeded per URL so sites differ
+_VOCABULARY = [f"term{i}" for i in range(400)] + [
+    "arbitration", "class action", "waive", "sell", "share", "third parties",
+    "automatically renew", "cancel", "refund", "modify these terms", "cookies", "retain"
+]
+
+
+def _sleep(env_name: str, default_ms: str):
+    median = float(os.getenv(env_name, default_ms)) / 1000
+    if median > 0:
+        time.sleep(random.lognormvariate(0, 0.5) * median)
+
+
+def _policy_markdown(url: str) -> str:
+    rng = random.Random(url)
+    words = int(os.getenv("STUB_POLICY_WORDS", "2500"))
+    paragraphs = []
+    while words > 0:
+        length = min(words, rng.randint(40, 120))
+        paragraphs.append(" ".join(rng.choice(_VOCABULARY) for _ in range(length)) + ".")
+        words -= length
+    return f"# Policy for {url}\n\n" + "\n\n".join(paragraphs)
+
+
+class StubFirecrawl:
+    """scrape_url / map_url with FirecrawlApp's response shapes"""
+
+    def scrape_url(self, url: str, params: dict = None) -> dict:
+        _sleep("STUB_FIRECRAWL_LATENCY_MS", "1500")
+        return {"markdown": _policy_markdown(url), "metadata": {"statusCode": 200, "sourceURL": url}}
+
+    def map_url(self, url: str, params: dict = None) -> dict:
+        _sleep("STUB_FIRECRAWL_LATENCY_MS", "1500")
+        base = url.rstrip("/")
+        return {"links": [f"{base}/privacy", f"{base}/terms", f"{base}/about", f"{base}/contact"]}
+
+
+class _StubUsage:
+    def __init__(self, prompt: str):
+        self.usage_metadata = {
+            "input_tokens": len(prompt) // 4,
+            "output_tokens": 400,
+            "total_tokens": len(prompt) // 4 + 400
+        }
+
+
+def _stub_value(name: str, annotation):
+    if annotation is bool or get_origin(annotation) is bool:
+        return True
+    if name.endswith("url"):
+        return f"https://stub.example/{name}"
+    if name == "message":
+        return "- Stub issue one\n- Stub issue two\n- Stub issue three"
+    return f"## Stub {name}\n- Generated by the upstream stub"
+
+
+class _StubStructured:
+    def __init__(self, schema, include_raw: bool):
+        self.schema = schema
+        self.include_raw = include_raw
+
+    def invoke(self, prompt):
+        _sleep("STUB_LLM_LATENCY_MS", "4000")
+        text = prompt.to_string() if hasattr(prompt, "to_string") else str(prompt)
+        parsed = self.schema(**{
+            name: _stub_value(name, field.annotation) for name, field in self.schema.model_fields.items()
+        })
+        if not self.include_raw:
+            return parsed
+        return {"raw": _StubUsage(text), "parsed": parsed, "parsing_error": None}
+
+
+class StubChatModel:
+    """Enough of a LangChain chat model for llm_pool's structured-output calls"""
+
+    def with_structured_output(self, schema, include_raw: bool = False):
+        return _StubStructured(schema, include_raw)
+
+
+def install_stubs():
+    """Swap this process's Firecrawl client and LLM pool for the stubs"""
+    from llm_pool import LLMPool, Provider, TokenRateLimiter, set_pool
+    from web_scraper import set_firecrawl
+
+    set_firecrawl(StubFirecrawl())
+    # Never spend real tokens when upstreams are stubbed
+    limiter = TokenRateLimiter(tokens_per_minute=1_000_000)
+    set_pool(LLMPool([
+        Provider("stub", 0, tier, f"stub-{tier}", "stub", None, limiter, client=StubChatModel())
+        for tier in ("fast", "strong")
+    ]))
+    print("Upstreams replaced by stubs")
+
+
+def stubbed_app():
+    """uvicorn factory: the API with stubbed upstreams, installed in every worker"""
+    install_stubs()
+    from server import app
+    return app
@@ -0,0 +1,56 @@
+"""
+Boilerplate removal in markdown_cleanup. Run from the backend directory with `pytest`.
+"""
+from clause_scanner import scan_policies
+from markdown_cleanup import clean_markdown
+
+POLICY = """We use cookies to improve your experience. [Cookie policy](https://example.com/cookies)
+
+[Accept all](#) | [Reject all](#)
+
+# Privacy Policy
+
+This policy explains what Example Inc. collects when you use our services, how long we keep it and who we share it with, and the choices you have about each of those uses.
+
+## Cookies
+
+We use cookies and similar technologies to share your browsing data with advertising partners.
+
+You can opt out in cookie settings, but we will sell personal information collected via cookie settings to data brokers.
+
+## Contact
+
+Write to privacy@example.com.
+
+Accept all cookies
+
+© 2024 Example Inc. All rights reserved.
+
+[Terms](https://example.com/terms) · [Privacy](https://example.com/privacy)
+"""
+
+
+def test_policy_clauses_about_cookies_survive():
+    cleaned, _ = clean_markdown(POLICY)
+
+    assert "share your browsing data with advertising partners" in cleaned
+    assert "we will sell personal information collected via cookie settings" in cleaned
+    assert "Write to privacy@example.com." in cleaned
+
+
+def test_leading_banner_and_trailing_footer_are_removed():
+    cleaned, report = clean_markdown(POLICY)
+
+    assert cleaned.startswith("# Privacy Policy")
+    assert "improve your experience" not in cleaned
+    assert "Accept all" not in cleaned
+    assert "All rights reserved" not in cleaned
+    assert report["removed_lines"] > 0
+
+
+def test_scanner_hits_survive_cleanup():
+    before = {hit["category"] for hit in scan_policies("", POLICY)}
+    cleaned, _ = clean_markdown(POLICY)
+
+    assert before
+    assert {hit["category"] for hit in scan_policies("", cleaned)} == before
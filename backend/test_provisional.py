@@ -0,0 +1,177 @@
+"""
+Placeholder lifecycle of the policy pipeline: a provisional result stored
+before the model runs must never outlive a failed run or hide the site
+from add_website. Run from the backend directory with `pytest`.
+"""
+import pytest
+
+import web_scraper
+
+POLICY_MARKDOWN = " ".join(f"clause{i} of these terms" for i in range(400))
+
+
+class RecordingDB:
+    """Just enough of MongoDBManager for _scraper_pipeline, recording placeholder calls"""
+
+    def __init__(self):
+        self.placeholders = {}
+        self.calls = []
+
+    def get_usage_totals(self, day, domain):
+        return {}, {}
+
+    def record_usage(self, *args):
+        pass
+
+    def find_policy_candidates(self, bands, exclude_url=None):
+        return []
+
+    def record_similarity_lookup(self, hit):
+        pass
+
+    def save_policy_document(self, *args, **kwargs):
+        pass
+
+    def save_provisional_website(self, url, message, extended_message):
+        self.calls.append("save")
+        if url in self.placeholders:
+            return False
+        self.placeholders[url] = {"message": message, "provisional": True, "pending": True}
+        return True
+
+    def finalize_provisional_website(self, url, message, extended_message):
+        self.calls.append("finalize")
+        if url in self.placeholders:
+            self.placeholders[url] = {"message": message, "provisional": False}
+
+    def discard_provisional_website(self, url):
+        self.calls.append("discard")
+        if self.placeholders.get(url, {}).get("pending"):
+            del self.placeholders[url]
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """Scraper pipeline with discovery and scraping stubbed out"""
+    monkeypatch.setattr(web_scraper, "discover_policy_urls",
+                        lambda root_url, db=None, refresh=False: (f"{root_url}/privacy", f"{root_url}/terms", False))
+    monkeypatch.setattr(web_scraper, "scrape_for_markdown",
+                        lambda url: {"markdown": POLICY_MARKDOWN, "metadata": {"statusCode": 200}})
+    return web_scraper.scraper_pipeline
+
+
+def test_failed_analysis_discards_placeholder(pipeline, monkeypatch):
+    def fail(*args):
+        raise RuntimeError("model unavailable")
+    monkeypatch.setattr(web_scraper, "invoke_structured_with_model", fail)
+    db = RecordingDB()
+
+    with pytest.raises(RuntimeError):
+        pipeline("https://example.com", db)
+
+    assert db.calls == ["save", "discard"]
+    assert "https://example.com" not in db.placeholders
+
+
+def test_failed_analysis_keeps_placeholder_of_another_run(pipeline, monkeypatch):
+    def fail(*args):
+        raise RuntimeError("model unavailable")
+    monkeypatch.setattr(web_scraper, "invoke_structured_with_model", fail)
+    db = RecordingDB()
+    db.placeholders["https://example.com"] = {"message": "running", "provisional": True, "pending": True}
+
+    with pytest.raises(RuntimeError):
+        pipeline("https://example.com", db)
+
+    assert "discard" not in db.calls
+    assert "https://example.com" in db.placeholders
+
+
+def test_spent_llm_budget_finalizes_placeholder(pipeline, monkeypatch):
+    monkeypatch.setattr(web_scraper, "llm_allowed", lambda: False)
+    db = RecordingDB()
+
+    message, extended_message = pipeline("https://example.com", db)
+
+    assert db.calls == ["save", "finalize"]
+    assert db.placeholders["https://example.com"] == {"message": message, "provisional": False}
+    # Nothing is running, so the stored result mustn't say an analysis is
+    assert "in progress" not in message and "in progress" not in extended_message
+
+
+def test_successful_analysis_finalizes_placeholder(pipeline, monkeypatch):
+    response = web_scraper.Default_Return_Schema(message="- a\n- b\n- c", extended_message="## Analysis")
+    monkeypatch.setattr(web_scraper, "invoke_structured_with_model", lambda *args: (response, "gpt-4o-mini"))
+    db = RecordingDB()
+
+    assert pipeline("https://example.com", db) == (response.message, response.extended_message)
+    assert db.calls == ["save", "finalize"]
+    assert db.placeholders["https://example.com"]["provisional"] is False
+
+
+@pytest.fixture
+def mongo_db():
+    """MongoDBManager over mongomock collections, without connecting"""
+    mongomock = pytest.importorskip("mongomock")
+    from database import MongoDBManager
+    db = MongoDBManager.__new__(MongoDBManager)
+    db.db = mongomock.MongoClient()["website_manager"]
+    db.collection = db.db["websites"]
+    db.collection.create_index([("url", 1)], unique=True)
+    db.counters = db.db["counters"]
+    db.website_details = db.db["website_details"]
+    return db
+
+
+def test_pending_placeholder_is_absent_until_finalized(mongo_db):
+    url = "https://example.com"
+    assert mongo_db.save_provisional_website(url, "scan", "## Scan")
+    assert not mongo_db.website_exists(url)
+
+    mongo_db.finalize_provisional_website(url, "model", "## Model")
+
+    document = mongo_db.collection.find_one({"url": url})
+    assert "pending" not in document
+    assert document["provisional"] is False
+    assert mongo_db.website_exists(url)
+
+
+def test_discarded_placeholder_is_removed(mongo_db):
+    url = "https://example.com"
+    mongo_db.save_provisional_website(url, "scan", "## Scan")
+
+    mongo_db.discard_provisional_website(url)
+
+    assert mongo_db.collection.find_one({"url": url}) is None
+    assert mongo_db.website_details.find_one({"_id": url}) is None
+
+
+def test_add_website_replaces_pending_placeholder(mongo_db):
+    url = "https://example.com"
+    mongo_db.save_provisional_website(url, "scan", "## Scan")
+
+    website_id = mongo_db.add_website(url, "model", "## Model", "- reviews", "## Reviews")
+
+    document = mongo_db.collection.find_one({"url": url})
+    assert website_id == str(document["_id"])
+    assert document["message"] == "model"
+    assert document["reviews_message"] == "- reviews"
+    assert "pending" not in document
+
+
+def test_snapshot_rows_skip_pending_placeholders(mongo_db):
+    mongo_db.save_provisional_website("https://pending.example.com", "scan", "## Scan")
+    mongo_db.save_provisional_website("https://done.example.com", "scan", "## Scan")
+    mongo_db.finalize_provisional_website("https://done.example.com", "model", "## Model")
+
+    assert [row["url"] for row in mongo_db.get_snapshot_rows()] == ["https://done.example.com"]
+
+
+def test_change_feed_skips_pending_placeholders(mongo_db):
+    url = "https://example.com"
+    mongo_db.save_provisional_website(url, "scan", "## Scan")
+    assert mongo_db.get_changes(0, settle_seconds=0) == []
+
+    mongo_db.finalize_provisional_website(url, "model", "## Model")
+
+    assert [change["url"] for change in mongo_db.get_changes(0, settle_seconds=0)] == [url]
@@ -0,0 +1,67 @@
+"""
+Circuit breaker and budget handling of call_upstream. Run from the backend
+directory with `pytest`.
+"""
+import time
+
+import pytest
+
+import resilience
+from resilience import BudgetExhausted, CircuitBreaker, CircuitOpenError, call_upstream, request_budget
+
+
+class Unavailable(Exception):
+    status_code = 503
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    """A fresh breaker for the "test" upstream that opens on one failure"""
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+    monkeypatch.setitem(resilience._breakers, "test", breaker)
+    return breaker
+
+
+def fail():
+    raise Unavailable("down")
+
+
+def test_spent_budget_leaves_half_open_trial_free(breaker):
+    with pytest.raises(Unavailable):
+        call_upstream("test", fail, timeout=1, retries=0)
+    assert breaker.state == "open"
+    time.sleep(0.06)
+
+    with request_budget(0):
+        with pytest.raises(BudgetExhausted):
+            call_upstream("test", lambda: "ok", timeout=1, retries=0)
+
+    assert call_upstream("test", lambda: "ok", timeout=1, retries=0) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_half_open_breaker_allows_one_trial(breaker):
+    with pytest.raises(Unavailable):
+        call_upstream("test", fail, timeout=1, retries=0)
+    time.sleep(0.06)
+
+    assert breaker.allow()
+    assert not breaker.allow()
+    with pytest.raises(CircuitOpenError):
+        call_upstream("test", lambda: "ok", timeout=1, retries=0)
+
+    breaker.record_neutral()
+    assert call_upstream("test", lambda: "ok", timeout=1, retries=0) == "ok"
+
+
+def test_failed_trial_reopens_breaker(breaker):
+    with pytest.raises(Unavailable):
+        call_upstream("test", fail, timeout=1, retries=0)
+    time.sleep(0.06)
+
+    with pytest.raises(Unavailable):
+        call_upstream("test", fail, timeout=1, retries=0)
+
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        call_upstream("test", lambda: "ok", timeout=1, retries=0)
@@ -0,0 +1,151 @@
+"""
+Trustpilot review page parsing. Run from the backend directory with `pytest`.
+"""
+from datetime import datetime
+
+import pytest
+
+from reviews import compute_review_stats, parse_reviews
+
+REVIEW_A = "65f0c1a2b3c4d5e6f7a8b9c0"
+REVIEW_B = "65f0c1a2b3c4d5e6f7a8b9c1"
+
+
+@pytest.fixture
+def review_page():
+    """Two review cards as Firecrawl renders a Trustpilot page: profile, rating, date, then the title permalink"""
+    return f"""# Example Reviews | Read Customer Service Reviews of example.com
+
+[Write a review](https://www.trustpilot.com/evaluate/example.com)
+
+[![](https://user-images.trustpilot.com/64a/73x73.png)
+
+John Smith
+
+US
+
+2 reviews](https://www.trustpilot.com/users/64a1b2c3d4e5f6a7b8c9d0e1)
+
+![Rated 1 out of 5 stars](https://cdn.trustpilot.net/brand-assets/4.1.0/stars/stars-1.svg)
+
+Mar 12, 2024
+
+[Never refunded my order](https://www.trustpilot.com/reviews/{REVIEW_A})
+
+They charged my card twice and support stopped answering.
+
+**Date of experience:** March 10, 2024
+
+Useful Share
+
+[JA
+
+Jane Adams
+
+GB
+
+1 review](https://www.trustpilot.com/users/64a1b2c3d4e5f6a7b8c9d0e2)
+
+![Rated 5 out of 5 stars](https://cdn.trustpilot.net/brand-assets/4.1.0/stars/stars-5.svg)
+
+Feb 2, 2024
+
+[Fast delivery](https://www.trustpilot.com/reviews/{REVIEW_B})
+
+Arrived in two days, well packed.
+
+**Date of experience:** January 30, 2024
+
+Useful Share
+"""
+
+
+def test_each_card_keeps_its_own_rating_and_date(review_page):
+    first, second = parse_reviews(review_page)
+
+    assert first["review_id"] == REVIEW_A
+    assert first["rating"] == 1
+    assert first["date"] == datetime(2024, 3, 10)
+    assert second["review_id"] == REVIEW_B
+    assert second["rating"] == 5
+    assert second["date"] == datetime(2024, 1, 30)
+
+
+def test_card_text_leaves_out_reviewer_profiles(review_page):
+    first, second = parse_reviews(review_page)
+
+    assert first["text"].startswith("Never refunded my order")
+    assert "support stopped answering" in first["text"]
+    assert "Jane" not in first["text"] and "John" not in first["text"]
+    assert second["text"].startswith("Fast delivery")
+
+
+def test_histogram_counts_parsed_ratings(review_page):
+    stats = compute_review_stats(parse_reviews(review_page), now=datetime(2024, 3, 20))
+
+    assert stats["histogram"] == {"1": 1, "2": 0, "3": 0, "4": 0, "5": 1}
+    assert stats["average"] == 3.0
+
+
+def test_page_without_profile_links_splits_at_permalinks():
+    markdown = (f"[Great](https://www.trustpilot.com/reviews/{REVIEW_A})\nRated 4 out of 5 stars\nLoved it\n"
+                f"[Bad](https://www.trustpilot.com/reviews/{REVIEW_B})\nRated 2 out of 5 stars\nHated it\n")
+
+    assert [(r["review_id"], r["rating"]) for r in parse_reviews(markdown)] == [(REVIEW_A, 4), (REVIEW_B, 2)]
+
+
+class ReviewsDB:
+    """Just enough of MongoDBManager for incremental_reviews_pipeline"""
+
+    def __init__(self):
+        self.reviews = []
+        self.summary = None
+
+    def get_review_summary(self, domain):
+        return self.summary
+
+    def get_recent_review_ids(self, domain, limit=200):
+        return {review["review_id"] for review in self.reviews}
+
+    def get_reviews(self, domain):
+        return list(self.reviews)
+
+    def save_reviews(self, domain, reviews):
+        self.reviews.extend(reviews)
+
+    def save_review_summary(self, domain, message, extended_message, analysis_version):
+        self.summary = {"message": message, "extended_message": extended_message}
+
+
+@pytest.fixture
+def reviews_pipeline(monkeypatch, review_page):
+    web_scraper = pytest.importorskip("web_scraper")
+    monkeypatch.setattr(web_scraper, "usage_level", lambda: "normal")
+    monkeypatch.setattr(web_scraper, "fetch_new_reviews",
+                        lambda domain, known_ids, scrape, max_pages:
+                            [r for r in parse_reviews(review_page) if r["review_id"] not in known_ids])
+    return web_scraper
+
+
+def test_reviews_are_stored_only_with_their_summary(reviews_pipeline, monkeypatch):
+    def fail(*args):
+        raise RuntimeError("model unavailable")
+    monkeypatch.setattr(reviews_pipeline, "invoke_structured_with_model", fail)
+    db = ReviewsDB()
+
+    with pytest.raises(RuntimeError):
+        reviews_pipeline.incremental_reviews_pipeline("example.com", db)
+    assert db.reviews == []
+
+    response = reviews_pipeline.Default_Return_Schema(message="- a\n- b\n- c", extended_message="## Reviews")
+    monkeypatch.setattr(reviews_pipeline, "invoke_structured_with_model", lambda *args: (response, "gpt-4o-mini"))
+    assert reviews_pipeline.incremental_reviews_pipeline("example.com", db) == ("- a\n- b\n- c", "## Reviews")
+    assert [r["review_id"] for r in db.reviews] == [REVIEW_A, REVIEW_B]
+
+
+def test_spent_llm_budget_leaves_reviews_unstored(reviews_pipeline, monkeypatch):
+    monkeypatch.setattr(reviews_pipeline, "llm_allowed", lambda: False)
+    db = ReviewsDB()
+
+    assert reviews_pipeline.incremental_reviews_pipeline("example.com", db) == (None, None)
+    assert db.reviews == []
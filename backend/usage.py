@@ -0,0 +1,187 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Optional
+
+# USD per 1M tokens (input, output). Models not listed are counted at no cost.
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "deepseek-chat": (0.27, 1.10),
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+    "llama-3.1-8b-instant": (0.05, 0.08),
+}
+
+# Budget levels, cheapest last:
+#   full   - normal pipelines
+#   fast   - every LLM stage runs on the fast tier
+#   local  - no LLM calls; policies get the local clause scanner's result,
+#            reviews the stored summary
+#   cached - no upstream calls at all; only stored results are served
+LEVELS = ("full", "fast", "local", "cached")
+
+
+class UsageBudgetExceeded(Exception):
+    """A pipeline needs an upstream its usage budget no longer allows"""
+
+
+class UsageRecorder:
+    """Usage of one pipeline run, per stage"""
+
+    def __init__(self, domain: str, endpoint: str, level: str = "full"):
+        self.domain = domain
+        self.endpoint = endpoint
+        self.level = level
+        self.stages = {}
+        self.started = time.perf_counter()
+        # Retries and hedges of one stage can record from several threads
+        self._lock = threading.Lock()
+
+    def _stage(self, stage: str) -> dict:
+        return self.stages.setdefault(stage, {
+            "calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0, "wall_ms": 0
+        })
+
+    def record_llm(self, stage: str, model: str, usage_metadata: Optional[dict], seconds: float):
+        usage_metadata = usage_metadata or {}
+        prompt_tokens = usage_metadata.get("input_tokens", 0)
+        completion_tokens = usage_metadata.get("output_tokens", 0)
+        input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+        with self._lock:
+            entry = self._stage(stage)
+            entry["calls"] += 1
+            entry["prompt_tokens"] += prompt_tokens
+            entry["completion_tokens"] += completion_tokens
+            entry["cost_usd"] += (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+            entry["wall_ms"] += int(seconds * 1000)
+
+    def record_firecrawl(self, stage: str, seconds: float):
+        """One Firecrawl request (attempt or hedge); each costs one credit"""
+        with self._lock:
+            entry = self._stage(stage)
+            entry["calls"] += 1
+            entry["wall_ms"] += int(seconds * 1000)
+
+    def snapshot(self) -> tuple[dict, dict]:
+        """(per-stage usage, totals); a timed-out attempt may still be recording"""
+        with self._lock:
+            stages = {k: dict(v) for k, v in self.stages.items()}
+        return stages, self._totals(stages)
+
+    def totals(self) -> dict:
+        return self.snapshot()[1]
+
+    def _totals(self, stages: dict) -> dict:
+        llm = [v for k, v in stages.items() if not k.startswith("firecrawl")]
+        return {
+            "runs": 1,
+            "llm_calls": sum(v["calls"] for v in llm),
+            "prompt_tokens": sum(v["prompt_tokens"] for v in llm),
+            "completion_tokens": sum(v["completion_tokens"] for v in llm),
+            "tokens": sum(v["prompt_tokens"] + v["completion_tokens"] for v in llm),
+            "cost_usd": sum(v["cost_usd"] for v in llm),
+            "firecrawl_credits": sum(v["calls"] for k, v in stages.items() if k.startswith("firecrawl")),
+            "wall_ms": int((time.perf_counter() - self.started) * 1000),
+        }
+
+
+_current_usage: ContextVar[Optional[UsageRecorder]] = ContextVar("current_usage", default=None)
+
+
+def current_usage() -> Optional[UsageRecorder]:
+    return _current_usage.get()
+
+
+def usage_level() -> str:
+    recorder = current_usage()
+    return recorder.level if recorder else "full"
+
+
+def llm_allowed() -> bool:
+    return usage_level() in ("full", "fast")
+
+
+def record_llm(stage: str, model: str, usage_metadata: Optional[dict], seconds: float):
+    recorder = current_usage()
+    if recorder is not None:
+        recorder.record_llm(stage, model, usage_metadata, seconds)
+
+
+def record_firecrawl(stage: str, seconds: float):
+    recorder = current_usage()
+    if recorder is not None:
+        recorder.record_firecrawl(stage, seconds)
+
+
+def usage_day(now: Optional[datetime] = None) -> str:
+    return (now or datetime.utcnow()).strftime("%Y-%m-%d")
+
+
+def seconds_until_reset(now: Optional[datetime] = None) -> int:
+    """Budgets are per UTC day"""
+    now = now or datetime.utcnow()
+    midnight = datetime(now.year, now.month, now.day) + timedelta(days=1)
+    return max(int((midnight - now).total_seconds()), 1)
+
+
+def usage_budgets() -> dict:
+    """Daily budgets from the environment; 0 or unset means unlimited"""
+    return {
+        "daily_tokens": int(os.getenv("USAGE_DAILY_TOKEN_BUDGET", "0")),
+        "domain_tokens": int(os.getenv("USAGE_DOMAIN_TOKEN_BUDGET", "0")),
+        "daily_firecrawl_credits": int(os.getenv("USAGE_DAILY_FIRECRAWL_BUDGET", "0")),
+        # Fraction of a token budget after which stages drop to the fast tier
+        "downgrade_at": float(os.getenv("USAGE_DOWNGRADE_AT", "0.8")),
+    }
+
+
+def budget_level(day_totals: dict, domain_totals: dict) -> str:
+    budgets = usage_budgets()
+    if budgets["daily_firecrawl_credits"] and \
+            day_totals.get("firecrawl_credits", 0) >= budgets["daily_firecrawl_credits"]:
+        return "cached"
+    ratios = []
+    if budgets["daily_tokens"]:
+        ratios.append(day_totals.get("tokens", 0) / budgets["daily_tokens"])
+    if budgets["domain_tokens"]:
+        ratios.append(domain_totals.get("tokens", 0) / budgets["domain_tokens"])
+    ratio = max(ratios, default=0.0)
+    if ratio >= 1:
+        return "local"
+    if ratio >= budgets["downgrade_at"]:
+        return "fast"
+    return "full"
+
+
+@contextmanager
+def usage_scope(db, domain: str, endpoint: str):
+    """
+    Account the block's LLM and Firecrawl usage to domain and endpoint, and
+    set its budget level from what the day has used so far. Without a db
+    nothing is enforced or stored.
+    """
+    level = "full"
+    if db is not None:
+        try:
+            day_totals, domain_totals = db.get_usage_totals(usage_day(), domain)
+            level = budget_level(day_totals, domain_totals)
+        except Exception as e:
+            print(f"Usage budget check failed, running unrestricted: {e}")
+    if level != "full":
+        print(f"Usage budget level for {domain}: {level}")
+
+    recorder = UsageRecorder(domain, endpoint, level)
+    token = _current_usage.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current_usage.reset(token)
+        stages, totals = recorder.snapshot()
+        if db is not None and stages:
+            try:
+                db.record_usage(usage_day(), domain, endpoint, stages, totals)
+            except Exception as e:
+                print(f"Usage recording failed: {e}")
@@ -1,86 +1,71 @@
-from firecrawl import FirecrawlApp
 from pydantic import BaseModel, Field
 from typing import Any, Optional, List
 from urllib.parse import urlsplit, urlunsplit, urljoin
-from langchain_openai.chat_models.base import ChatOpenAI, BaseChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.prompts import PromptTemplate
-from langchain_groq import ChatGroq
 import os
 from dotenv import load_dotenv
-from langchain_core.rate_limiters import BaseRateLimiter
+from llm_pool import invoke_structured, invoke_structured_with_model
+from similarity import minhash, lsh_bands, find_near_duplicate, adapt_analysis
+from clause_scanner import scan_policies, provisional_messages, format_hits_for_prompt
+from markdown_cleanup import clean_markdown
+from resilience import BudgetExhausted, call_upstream, current_budget, request_budget
+from usage import UsageBudgetExceeded, llm_allowed, record_firecrawl, usage_level, usage_scope
+from reviews import fetch_new_reviews, format_reviews_for_prompt, compute_review_stats, TRUSTPILOT_404_IMAGE
+import hashlib
+import json
+import threading
 import time
-load_dotenv()
-
-class TokenRateLimiter(BaseRateLimiter):
-    def __init__(self, tokens_per_minute: int):
-        self.tokens_per_minute = tokens_per_minute
-        self.tokens_used = 0
-        self.start_time = time.time()
-
-    def acquire(self, *, blocking: bool = True) -> bool:
-        current_time = time.time()
-        elapsed_time = current_time - self.start_time
-
-        # Reset tokens if a minute has passed
-        if elapsed_time >= 60:
-            self.tokens_used = 0
-            self.start_time = current_time
-
-        # Check if tokens are available
-        if self.tokens_used + 1 <= self.tokens_per_minute:
-            self.tokens_used += 1
-            return True
-        else:
-            if blocking:
-                # Wait until the next minute
-                time.sleep(60 - elapsed_time)
-                self.tokens_used = 0
-                self.start_time = time.time()
-                return True
-            else:
-                return False
-
-    async def aacquire(self, *, blocking: bool = True) -> bool:
-        return self.acquire(blocking=blocking)
-
-
-deepseek_api_key = os.getenv("OPENAI_API_KEY")
-print(f"API Key loaded: {bool(deepseek_api_key)}")  # Should show True
-groq_api_key=os.getenv("GROQ_API_KEY")
-
-# llm = BaseChatOpenAI(
-#     model='deepseek-chat',
-#     api_key=deepseek_api_key,
-#     base_url='https://api.deepseek.com/',
-#     max_tokens=8000
-# )
-rate_limiter = TokenRateLimiter(tokens_per_minute=2900)
-
-llm = ChatOpenAI(
-    model='gpt-4o-mini',
-    api_key=os.getenv('OPENAI_API_KEY_2'),
-    max_completion_tokens=3000,
-    rate_limiter=rate_limiter
 
-)
+# Firecrawl is built on first use so importing this module (every uvicorn
+# worker, every CLI) doesn't pay for its start-up. LLM clients live in
+# llm_pool, which routes each stage to a configured provider.
+_clients_lock = threading.Lock()
+_firecrawl_app = None
+
+def get_firecrawl():
+    """Return the shared Firecrawl client, creating it on first call"""
+    global _firecrawl_app
+    if _firecrawl_app is None:
+        with _clients_lock:
+            if _firecrawl_app is None:
+                load_dotenv()
+                _firecrawl_app = _timeout_firecrawl_class()(api_key=os.getenv('FIRECRAWL_API_KEY'))
+    return _firecrawl_app
+
+def set_firecrawl(client):
+    """Replace the shared Firecrawl client (load-test stubs)"""
+    global _firecrawl_app
+    with _clients_lock:
+        _firecrawl_app = client
+
+def _timeout_firecrawl_class():
+    """
+    FirecrawlApp whose HTTP requests have a socket timeout. The resilience
+    layer stops waiting on a slow call, but only this makes the thread
+    running it return instead of holding an upstream worker.
+    """
+    import requests
+    from firecrawl import FirecrawlApp
 
+    class TimeoutFirecrawlApp(FirecrawlApp):
+        http_timeout = float(os.getenv("FIRECRAWL_HTTP_TIMEOUT_SECONDS", "30"))
 
-# if not groq_api_key:
-#     raise ValueError("GROQ_API_KEY environment variable not set")
+        def _request_timeout(self, data: dict) -> float:
+            # Scrapes carry Firecrawl's own timeout in ms; allow a little for the response
+            if data.get("timeout"):
+                return min(data["timeout"] / 1000 + 5, self.http_timeout)
+            return self.http_timeout
 
-# llm = ChatGroq(
-#     model="llama-3.3-70b-versatile",
-#     temperature=0,
-#     max_tokens=None,
-#     timeout=None,
-#     max_retries=2,
-#     api_key=groq_api_key
-#     # other params...
-# )
+        # Single attempts: call_upstream does the retrying (and the SDK's
+        # own retries would spend more credits)
+        def _post_request(self, url, data, headers, *args, **kwargs):
+            return requests.post(url, headers=headers, json=data, timeout=self._request_timeout(data))
 
+        def _get_request(self, url, headers, *args, **kwargs):
+            return requests.get(url, headers=headers, timeout=self.http_timeout)
 
-app = FirecrawlApp(api_key=os.getenv('FIRECRAWL_API_KEY'))
+    return TimeoutFirecrawlApp
 
 class DefaultSchema(BaseModel):
     privacy_policy: str
@@ -94,15 +79,44 @@ class Check_URL_Schema(BaseModel):
     valid: bool
 
 def scrape_root_url(url: str, schema):
-    data = app.extract([url], {'prompt': 'Look in the footer of the website. Ignore links that are not of the same root domain as the site. Return "null" if you can\'t find one of the links. There is no shame in not finding one of the links.links that are just privacy, privacy policy, are the same. terms of use, terms and conditions, are the same', 'schema': schema.model_json_schema()})
+    data = get_firecrawl().extract([url], {'prompt': 'Look in the footer of the website. Ignore links that are not of the same root domain as the site. Return "null" if you can\'t find one of the links. There is no shame in not finding one of the links.links that are just privacy, privacy policy, are the same. terms of use, terms and conditions, are the same', 'schema': schema.model_json_schema()})
     print(data)
     return data
 
+def _firecrawl_timeout(env_name: str, default: str) -> float:
+    """Stage deadline: the configured cap, clipped to the request budget"""
+    cap = float(os.getenv(env_name, default))
+    budget = current_budget()
+    return budget.stage_timeout(cap) if budget else cap
+
+def _hedge_after() -> Optional[float]:
+    # Off unless set: every hedged request is another paid credit
+    hedge_after = os.getenv("FIRECRAWL_HEDGE_AFTER_SECONDS")
+    return float(hedge_after) if hedge_after else None
+
+def _firecrawl_attempt(stage: str, fn):
+    """fn, recording a credit for every run of it: each retry and hedge is a request"""
+    def attempt():
+        started = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            record_firecrawl(stage, time.perf_counter() - started)
+    return attempt
+
 def scrape_for_markdown(url: str):
-    response = app.scrape_url(url=url, params={
-	'formats': [ 'markdown' ],
-    })
-    return response
+    timeout = _firecrawl_timeout("FIRECRAWL_SCRAPE_TIMEOUT_SECONDS", "20")
+    return call_upstream(
+        "firecrawl",
+        _firecrawl_attempt("firecrawl_scrape", lambda: get_firecrawl().scrape_url(url=url, params={
+            'formats': [ 'markdown' ],
+            # Firecrawl's own timeout, in ms, so the server gives up too
+            'timeout': int(timeout * 1000),
+        })),
+        timeout=timeout,
+        retries=int(os.getenv("FIRECRAWL_RETRIES", "2")),
+        hedge_after=_hedge_after()
+    )
 
 
 def validate_url(input_url: Optional[str], root_url: str) -> str:
@@ -146,8 +160,6 @@ def validate_url(input_url: Optional[str], root_url: str) -> str:
     return combined
 
 
-import re
-from fuzzywuzzy import fuzz
 from urllib.parse import urlparse
 
 def find_policy_urls(urls):
@@ -161,6 +173,9 @@ def find_policy_urls(urls):
     Returns:
         list: Filtered list of URLs likely to be policy documents
     """
+    # Deferred: fuzzywuzzy is only needed on this path
+    from fuzzywuzzy import fuzz
+
     # List of potential keywords for privacy policies and terms
     policy_keywords = [
         # Privacy Policy variations
@@ -206,11 +221,17 @@ def find_policy_urls(urls):
 
 
 def try_getting_other_urls(base_url: str):
-    map_result = app.map_url(base_url, params={
-        'includeSubdomains': True,
-	'sitemapOnly': True,
-	'search': "privacy policy and terms"
-    })
+    map_result = call_upstream(
+        "firecrawl",
+        _firecrawl_attempt("firecrawl_map", lambda: get_firecrawl().map_url(base_url, params={
+            'includeSubdomains': True,
+            'sitemapOnly': True,
+            'search': "privacy policy and terms"
+        })),
+        timeout=_firecrawl_timeout("FIRECRAWL_MAP_TIMEOUT_SECONDS", "15"),
+        retries=int(os.getenv("FIRECRAWL_RETRIES", "2")),
+        hedge_after=_hedge_after()
+    )
     return map_result['links']
 
 class Classify_URLS_schema(BaseModel):
@@ -223,58 +244,74 @@ def get_URLS(urls: list[str]) -> tuple[str,str]:
        ('human', 'Here are the URLs:{urls}')
     ])
     prompt = classify_urls_template.invoke({'urls': ', '.join(urls)})
-    structured_llm = llm.with_structured_output(Classify_URLS_schema)
-    response = structured_llm.invoke(prompt)
+    response = invoke_structured("classify_urls", Classify_URLS_schema, prompt)
     return (response.privacy_policy_url, response.terms_url)
 
-def scraper_pipeline(root_url: str):
-    root_url = validate_url(None, root_url)
-
-    structured_llm = llm.with_structured_output(Default_Return_Schema)
-
-    try:
-        raw_urls = try_getting_other_urls(root_url)
-        privacy_policy_url, terms_url = get_URLS(raw_urls)
-    except:
-        print(f"couldn't scrape root url {root_url}, return AI generated message")
-        speculative_prompt = PromptTemplate.from_template(
-            """As a consumer rights watchdog, recall 3 exploitative practices for {root_url} based on industry patterns.
-            Output JSON with structure:
-            {{
-                "message": "3 bullet points\\n- [Issue 1]\\n- [Issue 2]\\n- [Issue 3]",
-                "extended_message": "Analysis assuming worst-case industry standards"
-            }}
-
-            Inference Rules:
-            1. Assume dark patterns common to this domain:
-               - Streaming: auto-renewals, content removal clauses
-               - E-commerce: restocking fees, return windows
-               - Social: data scraping, shadow profiles
-            2. For {root_url}, focus on their business model's likely abuses
-            3. Be sure, don't use words such as "likely", or "probably"
-
-            Example for "https://example-shop.com":
-            {{
-                "message": "- Likely 30% restocking fee hidden in FAQ\\n- Probable third-party data sharing for ads\\n- Suspected subscription auto-renewal by default",
-                "extended_message": "While unconfirmed, most retailers in this space..."
-            }}
-
-            Generate for {root_url} (JSON ONLY):"""
-        )
-
-
-        prompt = speculative_prompt.invoke({'root_url': root_url})
-        response = structured_llm.invoke(prompt)
-        return (response.message, response.extended_message)
-
+def match_policy_urls(urls: list[str]) -> tuple[str, str]:
+    """
+    get_URLS without the model: keyword-matched privacy policy and terms
+    URLs. A site with only one policy page gets it for both.
+    """
+    privacy_urls, terms_urls = [], []
+    for url in find_policy_urls(urls):
+        path = urlparse(url).path.lower()
+        if 'privacy' in path or 'data' in path:
+            privacy_urls.append(url)
+        else:
+            terms_urls.append(url)
+    if not privacy_urls and not terms_urls:
+        raise LookupError("No policy URLs matched")
+    # Shortest path first: /privacy over /privacy/cookies
+    privacy_urls.sort(key=len)
+    terms_urls.sort(key=len)
+    return (privacy_urls or terms_urls)[0], (terms_urls or privacy_urls)[0]
+
+def is_missing_page(response) -> bool:
+    """True when Firecrawl reports the scraped page as gone"""
+    status = (response or {}).get('metadata', {}).get('statusCode')
+    return status in (404, 410)
+
+def discover_policy_urls(root_url: str, db=None, refresh: bool = False) -> tuple[str, str, bool]:
+    """
+    Find the privacy policy and terms URLs for a site.
 
+    With a database, the map_url link list and the chosen URLs are cached
+    per domain; refresh=True ignores the cache and re-runs discovery.
 
-    terms_and_conditions_text = scrape_for_markdown(terms_url)['markdown']
-    privacy_policy_text = scrape_for_markdown(privacy_policy_url)['markdown']
+    Returns:
+        (privacy_policy_url, terms_url, from_cache)
+    """
+    domain = urlsplit(root_url).netloc
+    cached = db.get_discovery(domain) if db is not None and not refresh else None
 
+    if cached and cached["privacy_policy_url"] and cached["terms_url"]:
+        print(f"Using cached policy URLs for {domain}")
+        return cached["privacy_policy_url"], cached["terms_url"], True
 
-    schema_enforcement_prompt = PromptTemplate.from_template(
-        """You are a ruthless consumer rights lawyer analyzing these policies.
+    raw_urls = cached["links"] if cached else None
+    if not raw_urls:
+        raw_urls = try_getting_other_urls(root_url)
+        if db is not None:
+            db.save_discovery_links(domain, raw_urls)
+
+    if not llm_allowed():
+        # LLM budget spent: keyword matching, not cached so the model
+        # classifies the links once the budget allows it again
+        privacy_policy_url, terms_url = match_policy_urls(raw_urls)
+        return privacy_policy_url, terms_url, False
+
+    privacy_policy_url, terms_url = get_URLS(raw_urls)
+    if db is not None:
+        db.save_discovery_urls(domain, privacy_policy_url, terms_url)
+    return privacy_policy_url, terms_url, False
+
+def pipeline_budget() -> float:
+    """Seconds one pipeline run may spend on upstream calls"""
+    return float(os.getenv("PIPELINE_BUDGET_SECONDS", "40"))
+
+# Stored analyses are stamped with these so reanalysis.py can find the ones
+# produced by an older prompt or model. Any edit to a template changes its version.
+POLICY_ANALYSIS_TEMPLATE = """You are a ruthless consumer rights lawyer analyzing these policies.
         You MUST output JSON matching this exact structure:
         {{
             "message": "Three bullet points:\\n- First issue\\n- Second issue\\n- Third issue",
@@ -285,6 +322,9 @@ def scraper_pipeline(root_url: str):
         TERMS: {terms_and_conditions}
         PRIVACY: {privacy_policy}
 
+        SECTIONS FLAGGED BY AN AUTOMATED SCAN (verify them, they may be false positives):
+        {flagged_sections}
+
         RULES:
         1. "message" must have exactly 3 plain text bullet points
         2. "extended_message" must use ## headers and - lists
@@ -303,32 +343,219 @@ def scraper_pipeline(root_url: str):
 
         YOUR ANALYSIS (ONLY OUTPUT VALID JSON):
         """
-    )
 
-    # Test invocation
-    prompt = schema_enforcement_prompt.invoke({
-        "terms_and_conditions": terms_and_conditions_text,
-        "privacy_policy": privacy_policy_text,
+INCREMENTAL_REVIEWS_TEMPLATE = """Update the security/quality risk assessment for {company_name} using its customer reviews.
+
+        PREVIOUS ASSESSMENT (from older reviews, may be empty):
+        {previous_summary}
+
+        RATING STATISTICS (all stored reviews):
+        {stats}
+
+        NEW REVIEWS SINCE THE PREVIOUS ASSESSMENT:
+        {reviews}
+
+        RULES:
+        1. "message" must have exactly 3 plain text bullet points
+        2. "extended_message" must use ## headers and - lists
+        3. Never use colons or unescaped quotes in JSON values
+        4. Output must parse with json.loads() FIRST TRY
+
+        Focus on:
+        • Financial risks (hidden fees, refund denials)
+        • Data security mentions (hacks, phishing, scams)
+        • Product/service consistency failures
+        • Support responsiveness
+
+        Keep points from the previous assessment that still hold and note where the new reviews change the picture.
+        Be concise and to the point. Avoid flowery language. Only say things that can be directly supported in the text.
+       """
+
+# Stamp of policy analyses served from the clause scanner because the LLM
+# budget was spent; reanalysis.py treats them as outdated
+LOCAL_SCANNER_VERSION = {"prompt_version": "clause_scanner", "model": None}
+
+PROMPT_VERSIONS = {
+    "policy_analysis": hashlib.sha256(POLICY_ANALYSIS_TEMPLATE.encode()).hexdigest()[:12],
+    "reviews_analysis": hashlib.sha256(INCREMENTAL_REVIEWS_TEMPLATE.encode()).hexdigest()[:12],
+}
+
+def analysis_version(stage: str, model: str) -> dict:
+    return {"prompt_version": PROMPT_VERSIONS[stage], "model": model}
+
+def build_policy_prompt(terms_text: str, privacy_text: str, clause_hits, root_url: str):
+    return PromptTemplate.from_template(POLICY_ANALYSIS_TEMPLATE).invoke({
+        "terms_and_conditions": terms_text,
+        "privacy_policy": privacy_text,
+        "flagged_sections": format_hits_for_prompt(clause_hits),
         "root_url": root_url
     })
-    response = structured_llm.invoke(prompt)
 
-    # Check if response failed
+def build_reviews_prompt(website: str, previous_summary: str, stats: dict, reviews: list[dict]):
+    return PromptTemplate.from_template(INCREMENTAL_REVIEWS_TEMPLATE).invoke({
+        'company_name': website,
+        'previous_summary': previous_summary,
+        'stats': json.dumps({k: v for k, v in stats.items() if k != "monthly"}),
+        'reviews': format_reviews_for_prompt(reviews)
+    })
+
+def speculative_analysis(root_url: str) -> tuple[str, str]:
+    """Analysis from the model's knowledge of the site, when its policies can't be found"""
+    speculative_prompt = PromptTemplate.from_template(
+        """As a consumer rights watchdog, recall 3 exploitative practices for {root_url} based on industry patterns.
+        Output JSON with structure:
+        {{
+            "message": "3 bullet points\\n- [Issue 1]\\n- [Issue 2]\\n- [Issue 3]",
+            "extended_message": "Analysis assuming worst-case industry standards"
+        }}
+
+        Inference Rules:
+        1. Assume dark patterns common to this domain:
+           - Streaming: auto-renewals, content removal clauses
+           - E-commerce: restocking fees, return windows
+           - Social: data scraping, shadow profiles
+        2. For {root_url}, focus on their business model's likely abuses
+        3. Be sure, don't use words such as "likely", or "probably"
+
+        Example for "https://example-shop.com":
+        {{
+            "message": "- Likely 30% restocking fee hidden in FAQ\\n- Probable third-party data sharing for ads\\n- Suspected subscription auto-renewal by default",
+            "extended_message": "While unconfirmed, most retailers in this space..."
+        }}
+
+        Generate for {root_url} (JSON ONLY):"""
+    )
+    prompt = speculative_prompt.invoke({'root_url': root_url})
+    response = invoke_structured("speculative", Default_Return_Schema, prompt)
+    return (response.message, response.extended_message)
+
+def scraper_pipeline(root_url: str, db=None, on_provisional=None, endpoint: str = "policy_pipeline"):
+    domain = urlsplit(validate_url(None, root_url)).netloc
+    with request_budget(pipeline_budget()), usage_scope(db, domain, endpoint):
+        return _scraper_pipeline(root_url, db, on_provisional)
 
+def _scraper_pipeline(root_url: str, db=None, on_provisional=None):
+    root_url = validate_url(None, root_url)
+    if usage_level() == "cached":
+        raise UsageBudgetExceeded(f"Daily Firecrawl budget spent, can't analyze {root_url} until it resets")
+
+    try:
+        privacy_policy_url, terms_url, from_cache = discover_policy_urls(root_url, db)
+    except (BudgetExhausted, UsageBudgetExceeded):
+        raise
+    except Exception as e:
+        print(f"couldn't scrape root url {root_url} ({e}), return AI generated message")
+        return speculative_analysis(root_url)
+
+    terms_response = scrape_for_markdown(terms_url)
+    privacy_response = scrape_for_markdown(privacy_policy_url)
+
+    # A stored URL that now 404s means the site moved its policies
+    if from_cache and (is_missing_page(terms_response) or is_missing_page(privacy_response)):
+        print(f"Cached policy URL for {root_url} is gone, re-running discovery")
+        db.invalidate_discovery_urls(urlsplit(root_url).netloc)
+        try:
+            privacy_policy_url, terms_url, _ = discover_policy_urls(root_url, db, refresh=True)
+            terms_response = scrape_for_markdown(terms_url)
+            privacy_response = scrape_for_markdown(privacy_policy_url)
+            if is_missing_page(terms_response) or is_missing_page(privacy_response):
+                raise RuntimeError("rediscovered policy URL is missing too")
+        except (BudgetExhausted, UsageBudgetExceeded):
+            raise
+        except Exception as e:
+            # Don't analyze the 404 pages
+            print(f"Rediscovery failed for {root_url} ({e}), return AI generated message")
+            return speculative_analysis(root_url)
+
+    # Strip navigation, banners, link targets and repeats before prompting
+    token_budget = int(os.getenv("POLICY_TOKEN_BUDGET", "12000"))
+    terms_and_conditions_text, terms_report = clean_markdown(terms_response['markdown'], token_budget)
+    privacy_policy_text, privacy_report = clean_markdown(privacy_response['markdown'], token_budget)
+    print(f"Terms tokens {terms_report['tokens_before']} -> {terms_report['tokens_after']}, "
+          f"privacy tokens {privacy_report['tokens_before']} -> {privacy_report['tokens_after']}")
+
+    # Platform boilerplate (Shopify, Squarespace, ...) is often already analyzed
+    signature = minhash(terms_and_conditions_text + "\n" + privacy_policy_text)
+    if db is not None and signature is not None:
+        # Estimated Jaccard similarity above which a stored analysis is reused
+        threshold = float(os.getenv("SIMILARITY_THRESHOLD", "0.9"))
+        match = find_near_duplicate(db, signature, threshold, root_url)
+        if match:
+            source, similarity = match
+            print(f"Reusing analysis of {source['url']} for {root_url} (similarity {similarity:.2f})")
+            message = adapt_analysis(source["message"], source["url"], root_url)
+            extended_message = adapt_analysis(source["extended_message"], source["url"], root_url)
+            db.save_policy_document(
+                root_url, terms_and_conditions_text, privacy_policy_text,
+                signature, lsh_bands(signature), message, extended_message,
+                reused_from=source["url"],
+                analysis_version=source.get("analysis_version")
+            )
+            return (message, extended_message)
+
+    # Quick local scan: served as a provisional result while the model runs,
+    # and its hits steer the model to the relevant sections
+    clause_hits = scan_policies(terms_and_conditions_text, privacy_policy_text)
+    provisional_message, provisional_extended_message = provisional_messages(clause_hits)
+    created_placeholder = False
+    if db is not None:
+        created_placeholder = db.save_provisional_website(root_url, provisional_message, provisional_extended_message)
+    if on_provisional is not None:
+        on_provisional(provisional_message, provisional_extended_message)
+
+    if not llm_allowed():
+        # LLM budget spent: the scanner result stands until reanalysis.py runs
+        print(f"LLM budget spent, serving clause scanner result for {root_url}")
+        message, extended_message = provisional_messages(clause_hits, analysis_running=False)
+        if db is not None:
+            db.save_policy_document(
+                root_url, terms_and_conditions_text, privacy_policy_text,
+                signature, lsh_bands(signature) if signature else [],
+                message, extended_message,
+                analysis_version=LOCAL_SCANNER_VERSION
+            )
+            db.finalize_provisional_website(root_url, message, extended_message)
+        return (message, extended_message)
+
+
+    prompt = build_policy_prompt(terms_and_conditions_text, privacy_policy_text, clause_hits, root_url)
+    try:
+        response, model = invoke_structured_with_model("policy_analysis", Default_Return_Schema, prompt)
+    except Exception:
+        # A placeholder left behind would hide the site from add_website
+        if created_placeholder:
+            db.discard_provisional_website(root_url)
+        raise
+
+    if db is not None:
+        db.save_policy_document(
+            root_url, terms_and_conditions_text, privacy_policy_text,
+            signature, lsh_bands(signature) if signature else [],
+            response.message, response.extended_message,
+            analysis_version=analysis_version("policy_analysis", model)
+        )
+        db.finalize_provisional_website(root_url, response.message, response.extended_message)
 
     return (response.message, response.extended_message)
 
 
 
-def scrape_reviews_pipeline(website: str):
+def scrape_reviews_pipeline(website: str, db=None, endpoint: str = "reviews_pipeline"):
+    with request_budget(pipeline_budget()), usage_scope(db, website, endpoint):
+        if db is not None:
+            return incremental_reviews_pipeline(website, db)
+        return _reviews_pipeline(website)
+
+def _reviews_pipeline(website: str):
+
     try:
         reviews = scrape_for_markdown(f"https://trustpilot.com/review/{website}")
        # print(reviews)
-        if "https://images-static.trustpilot.com/community/errors/404_beige.png" in reviews['markdown']:
-            print("error1")
+        if TRUSTPILOT_404_IMAGE in reviews['markdown']:
+            print(f"No Trustpilot page for {website}")
             return None, None
-    except:
-        print("error2")
+    except Exception as e:
+        print(f"Trustpilot scrape failed for {website}: {e}")
         return None, None
 
 
@@ -356,10 +583,69 @@ def scrape_reviews_pipeline(website: str):
         If no customer reviews are available, say that there no reviews available for both fields.
        """
     )
-    # hello world
-    prompt = review_analysis_prompt.invoke({'reviews': reviews['markdown'], 'company_name': website})
-    structured_llm = llm.with_structured_output(Default_Return_Schema)
-    response = structured_llm.invoke(prompt)
+    reviews_text, report = clean_markdown(reviews['markdown'], int(os.getenv("REVIEWS_TOKEN_BUDGET", "8000")))
+    print(f"Review tokens {report['tokens_before']} -> {report['tokens_after']}")
+    prompt = review_analysis_prompt.invoke({'reviews': reviews_text, 'company_name': website})
+    response = invoke_structured("reviews_analysis", Default_Return_Schema, prompt)
+    return (response.message, response.extended_message)
+
+
+def incremental_reviews_pipeline(website: str, db):
+    """
+    Ingest only reviews newer than the last run and update the stored summary.
+
+    Reviews are parsed into records and kept per domain. The model sees the
+    previous summary, locally computed rating stats and the new reviews only;
+    with no new reviews the stored summary is returned without a model call.
+    New reviews are stored only once their summary is saved, so a failed or
+    skipped model call leaves them to be fetched and summarized next run.
+    """
+    summary = db.get_review_summary(website)
+    if usage_level() == "cached":
+        print(f"Firecrawl budget spent, serving stored review summary for {website}")
+        return (summary["message"], summary["extended_message"]) if summary else (None, None)
+    known_ids = db.get_recent_review_ids(website, limit=200)
+    max_pages = int(os.getenv("REVIEWS_MAX_PAGES", "5"))
+
+    try:
+        new_reviews = fetch_new_reviews(website, known_ids, scrape_for_markdown, max_pages)
+    except Exception as e:
+        print(f"Review fetch failed for {website}: {e}")
+        if summary:
+            return (summary["message"], summary["extended_message"])
+        return None, None
+
+    if new_reviews is None:
+        return None, None
+    if not new_reviews and summary:
+        print(f"No new reviews for {website}, reusing stored summary")
+        return (summary["message"], summary["extended_message"])
+    if not llm_allowed():
+        # New reviews stay unstored, so the next run fetches and summarizes them
+        print(f"LLM budget spent, serving stored review summary for {website}")
+        return (summary["message"], summary["extended_message"]) if summary else (None, None)
+    if not new_reviews and not known_ids:
+        # Page exists but no review cards parsed; analyze it the old way
+        return _reviews_pipeline(website)
+
+    stored_reviews = db.get_reviews(website)
+    if new_reviews:
+        stats = compute_review_stats(stored_reviews + new_reviews)
+        prompt_reviews = new_reviews
+    else:
+        # Stored by an earlier run but never summarized: summarize them from scratch
+        print(f"No summary for {website}, summarizing its stored reviews")
+        stats = compute_review_stats(stored_reviews)
+        prompt_reviews = db.get_review_records(website, limit=200)
+
+    prompt = build_reviews_prompt(website, summary["extended_message"] if summary else "", stats, prompt_reviews)
+    response, model = invoke_structured_with_model("reviews_analysis", Default_Return_Schema, prompt)
+    db.save_review_summary(
+        website, response.message, response.extended_message,
+        analysis_version=analysis_version("reviews_analysis", model)
+    )
+    if new_reviews:
+        db.save_reviews(website, new_reviews)
     return (response.message, response.extended_message)
 
 if __name__ == "__main__":